@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import chess
+import chess.polyglot
+
+
+@dataclass
+class CacheEntry:
+    """A search result stored in the analysis cache"""
+    best_move: str
+    ponder_move: str | None
+    # ("cp", centipawns) or ("mate", moves), from the side to move's point of view
+    score: tuple | None
+    depth: int
+    # The principal variation in UCI moves
+    pv: list = field(default_factory=list)
+
+
+class AnalysisCache:
+    """
+    LRU cache of search results keyed by the Zobrist hash of the position
+    and the search settings. A result searched deeper than requested
+    satisfies the request
+    """
+
+    # Rough size of an entry with its key and bookkeeping, in bytes
+    ENTRY_SIZE = 400
+
+    def __init__(self, memory=16) -> None:
+        """
+        Args:
+            memory: The memory cap in MB
+        """
+        self.max_entries = max(1, memory * 1024 * 1024 // self.ENTRY_SIZE)
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(board: chess.Board, skill_level, multipv=1) -> tuple:
+        return chess.polyglot.zobrist_hash(board), skill_level, multipv
+
+    def get(self, board: chess.Board, depth, skill_level, multipv=1) -> CacheEntry | None:
+        """Returns the entry of the position if it was searched at least as deep as depth"""
+        key = self.key(board, skill_level, multipv)
+        entry = self._entries.get(key)
+        if entry is None or entry.depth < depth:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, board: chess.Board, entry: CacheEntry, skill_level, multipv=1) -> None:
+        """Stores the entry unless a deeper one is already stored"""
+        key = self.key(board, skill_level, multipv)
+        stored = self._entries.get(key)
+        if stored is not None and stored.depth > entry.depth:
+            self._entries.move_to_end(key)
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate), {len(self)} entries"
@@ -0,0 +1,185 @@
+"""
+Offline end-to-end benchmark of the bot game loop.
+Plays games against a ReplayGrabber opponent with a fake UCI engine,
+without a browser, a chess site or Stockfish.
+Like in the browser, a single bot process and engine play all the games.
+Usage: python -m src.bench [--games N] [--pgn FILE] [--think-ms N] [--delay-ms N]
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+import tracemalloc
+
+import chess.pgn
+
+from ..protocol import Startup, Timing, decode
+from ..grabbers.grabber import PageSnapshot
+from ..stockfish_bot import StockfishBot
+from .replay_grabber import ReplayGrabber, ReplayMouse
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PGN_PATH = os.path.join(BENCH_DIR, "games.pgn")
+FAKE_ENGINE_PATH = os.path.join(BENCH_DIR, "fake_engine.py")
+
+
+class PipeSink:
+    """Stands in for the GUI end of the pipe"""
+
+    def __init__(self) -> None:
+        # Latency samples of every bot move, in milliseconds by stage
+        self.moves = []
+        # Time to the first move of every game
+        self.startups = []
+
+    def send_bytes(self, data) -> None:
+        for message in decode(data):
+            if isinstance(message, Timing):
+                self.moves.append(message.move)
+            elif isinstance(message, Startup):
+                self.startups.append(message)
+
+
+class BenchBot(StockfishBot):
+    """StockfishBot playing against a ReplayGrabber"""
+
+    def __init__(self, grabber: ReplayGrabber, next_games, pipe: PipeSink, think_ms, mouseless) -> None:
+        super().__init__(
+            chrome_url=None,
+            chrome_session_id=None,
+            website="replay",
+            pipe=pipe,
+            stockfish_path=[sys.executable, FAKE_ENGINE_PATH, "--think-ms", str(think_ms)],
+            enable_manual_mode=False,
+            enable_mouseless_mode=mouseless,
+            enable_non_stop_puzzles=False,
+            bongcloud=False,
+            slow_mover=100,
+            skill_level=20,
+            stockfish_depth=10,
+            memory=16,
+            cpu_threads=1,
+        )
+        self.replay_grabber = grabber
+        self.mouse = ReplayMouse(grabber)
+        # (game, bot is white) pairs loaded after the first game
+        self.next_games = iter(next_games)
+        # Traced heap size when the first game ended, if tracing
+        self.heap_after_first_game = None
+
+    def _create_grabber(self) -> ReplayGrabber:
+        return self.replay_grabber
+
+    def _end_game(self) -> None:
+        # The benchmark reports the statistics of all the games at the end
+        pass
+
+    def _wait_for_next_game(self) -> PageSnapshot | None:
+        # Load the next game at once instead of waiting for the page
+        if self.heap_after_first_game is None and tracemalloc.is_tracing():
+            # Measure the growth after the first game warmed everything up
+            self.heap_after_first_game = tracemalloc.get_traced_memory()[0]
+        next_game = next(self.next_games, None)
+        if next_game is None:
+            return None
+        self.replay_grabber.load(*next_game)
+        return self.replay_grabber.snapshot()
+
+
+def percentile(samples, p) -> float:
+    samples = sorted(samples)
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(p / 100 * len(samples)))]
+
+
+def max_rss_kb() -> int | None:
+    if resource is None:
+        return None
+    # Kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--games", type=int, default=100, help="Number of games to play")
+    parser.add_argument("--pgn", default=DEFAULT_PGN_PATH, help="Games replayed by the opponent")
+    parser.add_argument("--think-ms", type=float, default=5, help="Fake engine think time")
+    parser.add_argument("--delay-ms", type=float, default=0, help="Opponent delay per move")
+    parser.add_argument("--max-plies", type=int, default=80, help="Plies after which a game ends")
+    parser.add_argument("--mouseless", action="store_true", help="Make mouseless moves")
+    parser.add_argument("--trace-memory", action="store_true", help="Trace Python heap growth")
+    args = parser.parse_args()
+
+    games = []
+    with open(args.pgn, encoding="utf-8") as f:
+        while (game := chess.pgn.read_game(f)) is not None:
+            games.append(game)
+    if not games:
+        parser.error(f"no games found in {args.pgn}")
+
+    if args.trace_memory:
+        tracemalloc.start()
+    rss_before = max_rss_kb()
+    wall_started = time.perf_counter()
+    cpu_started = time.process_time()
+
+    # The bot plays white in the even games
+    schedule = [
+        (game, i % 2 == 0) for i, game in zip(range(args.games), itertools.cycle(games))
+    ]
+    pipe = PipeSink()
+    grabber = ReplayGrabber(
+        *schedule[0], delay=args.delay_ms / 1000, max_plies=args.max_plies
+    )
+    bot = BenchBot(grabber, schedule[1:], pipe, args.think_ms, args.mouseless)
+    bot.run()
+
+    wall = time.perf_counter() - wall_started
+    cpu = time.process_time() - cpu_started
+
+    moves = pipe.moves
+    totals = [move["total"] for move in moves]
+    overheads = [move["total"] - move.get("think", 0) for move in moves]
+    print(f"games:                 {args.games}")
+    print(f"bot moves:             {len(moves)}")
+    print(f"wall time:             {wall:.2f} s")
+    print(f"moves/sec:             {len(moves) / wall:.1f}")
+    print(
+        f"move latency:          p50 {percentile(totals, 50):.2f} ms, "
+        f"p95 {percentile(totals, 95):.2f} ms, p99 {percentile(totals, 99):.2f} ms"
+    )
+    print(
+        f"overhead outside think: p50 {percentile(overheads, 50):.2f} ms, "
+        f"p95 {percentile(overheads, 95):.2f} ms, p99 {percentile(overheads, 99):.2f} ms"
+    )
+    if pipe.startups:
+        first, *warm = pipe.startups
+        print(
+            f"time to first move:    {first.first_move:.1f} ms "
+            f"(engine {first.engine:.1f} ms, page {first.page:.1f} ms)"
+        )
+        warm_times = [startup.first_move for startup in warm]
+        print(
+            f"next games first move: p50 {percentile(warm_times, 50):.2f} ms, "
+            f"p95 {percentile(warm_times, 95):.2f} ms"
+        )
+    print(f"loop CPU usage:        {cpu / wall * 100:.1f}% of one core")
+    rss_after = max_rss_kb()
+    if rss_before is not None:
+        print(f"max RSS growth:        {rss_after - rss_before} KB")
+    if args.trace_memory:
+        heap = tracemalloc.get_traced_memory()[0]
+        print(f"heap growth after first game: {(heap - bot.heap_after_first_game) / 1024:.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+A fake UCI engine for benchmarks, with a deterministic move choice
+and a configurable think time.
+Usage: python fake_engine.py [--think-ms N]
+"""
+import argparse
+import sys
+import threading
+
+import chess
+import chess.polyglot
+
+
+def choose_move(board: chess.Board) -> chess.Move | None:
+    """Picks a legal move from the position hash, never underpromoting"""
+    moves = sorted(
+        (m for m in board.legal_moves if m.promotion in (None, chess.QUEEN)),
+        key=lambda m: m.uci(),
+    )
+    if not moves:
+        return None
+    return moves[chess.polyglot.zobrist_hash(board) % len(moves)]
+
+
+class FakeEngine:
+    def __init__(self, think_time) -> None:
+        self.think_time = think_time
+        self.board = chess.Board()
+        self.stop_event = threading.Event()
+        # Set by ponderhit, and by stop to end a ponder search at once
+        self.ponder_end_event = threading.Event()
+        self.search_thread = None
+
+    def send(self, line) -> None:
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+    def search(self, board: chess.Board, ponder) -> None:
+        if ponder:
+            # Think once the ponder move is played
+            self.ponder_end_event.wait()
+        self.stop_event.wait(self.think_time)
+
+        move = choose_move(board)
+        if move is None:
+            self.send("bestmove (none)")
+            return
+        board.push(move)
+        reply = choose_move(board)
+        nodes = int(self.think_time * 1_000_000) + 1
+        pv = move.uci() if reply is None else f"{move.uci()} {reply.uci()}"
+        self.send(f"info depth 10 score cp 0 nodes {nodes} nps 1000000 pv {pv}")
+        self.send(f"bestmove {move.uci()}" + ("" if reply is None else f" ponder {reply.uci()}"))
+
+    def set_position(self, tokens) -> None:
+        if tokens[0] == "startpos":
+            self.board = chess.Board()
+            tokens = tokens[1:]
+        elif tokens[0] == "fen":
+            self.board = chess.Board(" ".join(tokens[1:7]))
+            tokens = tokens[7:]
+        if tokens and tokens[0] == "moves":
+            for move in tokens[1:]:
+                self.board.push_uci(move)
+
+    def wait_for_search(self) -> None:
+        if self.search_thread is not None:
+            self.search_thread.join()
+            self.search_thread = None
+
+    def run(self) -> None:
+        for line in sys.stdin:
+            tokens = line.split()
+            if not tokens:
+                continue
+            command = tokens[0]
+            if command == "uci":
+                self.send("id name FakeEngine")
+                self.send("uciok")
+            elif command == "isready":
+                self.send("readyok")
+            elif command == "position":
+                self.set_position(tokens[1:])
+            elif command == "go":
+                self.wait_for_search()
+                self.stop_event.clear()
+                self.ponder_end_event.clear()
+                self.search_thread = threading.Thread(
+                    target=self.search, args=(self.board.copy(), "ponder" in tokens)
+                )
+                self.search_thread.start()
+            elif command == "ponderhit":
+                self.ponder_end_event.set()
+            elif command == "stop":
+                self.stop_event.set()
+                self.ponder_end_event.set()
+                self.wait_for_search()
+            elif command == "quit":
+                self.stop_event.set()
+                self.ponder_end_event.set()
+                self.wait_for_search()
+                return
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--think-ms", type=float, default=10, help="Think time per move")
+    args = parser.parse_args()
+    FakeEngine(args.think_ms / 1000).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Runs the grabber methods against the DOM fixture pages in headless Chrome,
+checks what they read against fixtures/expected.json and measures the
+WebDriver round trips and the wall time of every call.
+The fixtures are served from a local HTTP server, so no chess site is needed.
+They are synthetic pages written by make_fixtures, not saved pages of the sites,
+and the harness has not been run in Chrome or against the real sites' markup yet.
+With --devtools the grabber scripts run over the DevTools websocket of Chrome.
+Usage: python -m src.bench.grabber_harness [--site lichess] [--repeat 20] [--fixture game] [--devtools]
+"""
+import argparse
+import functools
+import http.server
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+
+from ..grabbers.chesscom_grabber import ChesscomGrabber
+from ..grabbers.grabber import Grabber
+from ..grabbers.lichess_grabber import LichessGrabber
+from .make_fixtures import EXPECTED_PATH, FIXTURES_DIR
+
+GRABBERS = {
+    "lichess": LichessGrabber,
+    "chesscom": ChesscomGrabber,
+}
+
+# Removes the marks the move list scripts leave on the moves they read,
+# so every repeat reads the whole move list again
+_RESET_SCRIPT = """
+document.querySelectorAll("[data-processed]").forEach((move) => move.removeAttribute("data-processed"));
+"""
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def serve_fixtures() -> http.server.ThreadingHTTPServer:
+    """Serves the fixtures directory on a free local port from a daemon thread"""
+    handler = functools.partial(_QuietHandler, directory=FIXTURES_DIR)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_chrome() -> webdriver.Chrome:
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless=new")
+    options.add_argument("--window-size=1280,1000")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-gpu")
+    return webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+
+
+class RoundTripCounter:
+    """
+    Counts the WebDriver commands sent by a grabber, one HTTP round trip each,
+    and its DevTools commands, one websocket message and reply each
+    """
+
+    def __init__(self, grabber: Grabber) -> None:
+        self.count = 0
+        execute = grabber.chrome.execute
+
+        def counting_execute(command, params=None):
+            self.count += 1
+            return execute(command, params)
+
+        # Only this driver instance is wrapped, the WebDriver class is left alone
+        grabber.chrome.execute = counting_execute
+
+        if grabber.devtools is not None:
+            call = grabber.devtools._call
+
+            def counting_call(method, params, timeout=None):
+                self.count += 1
+                return call(method, params, timeout)
+
+            grabber.devtools._call = counting_call
+
+
+def _read_moves(grabber: Grabber) -> list | None:
+    return grabber.get_move_list()
+
+
+def _read_snapshot(grabber: Grabber) -> object:
+    return grabber.snapshot()
+
+
+def _read_separately(grabber: Grabber) -> tuple:
+    # The state read one method per call, as before the snapshot script
+    grabber.update_board_element()
+    return (
+        grabber.is_game_over(),
+        grabber.is_game_puzzles(),
+        grabber.is_white(),
+        grabber.get_top_left_corner(),
+        grabber.get_move_list(),
+    )
+
+
+# name: (call, whether the move list is read from scratch on every repeat)
+CALLS = {
+    "snapshot": (_read_snapshot, True),
+    "snapshot (incremental)": (_read_snapshot, False),
+    "get_move_list": (_read_moves, True),
+    "get_move_list (incremental)": (_read_moves, False),
+    "get_geometry": (lambda grabber: grabber.get_geometry(), False),
+    "get_fen": (lambda grabber: grabber.get_fen(), False),
+    "separate calls": (_read_separately, True),
+}
+
+
+def check(grabber: Grabber, expected: dict) -> list:
+    """Returns the differences between what the grabber reads and the expected values"""
+    grabber.moves_list = {}
+    grabber.chrome.execute_script(_RESET_SCRIPT)
+    snapshot = grabber.snapshot()
+    clocks = snapshot.clocks
+    fen = grabber.get_fen()
+    actual = {
+        "game_over": snapshot.game_over,
+        "is_puzzles": snapshot.is_puzzles,
+        "is_white": snapshot.is_white,
+        "ply_count": snapshot.ply_count,
+        "moves": snapshot.move_list,
+        "fen": None if fen is None else fen.split()[0],
+        "clocks": None if clocks is None else [
+            clocks.white_time, clocks.black_time, clocks.white_increment, clocks.black_increment
+        ],
+    }
+    errors = [
+        f"{name}: expected {expected[name]!r}, got {value!r}"
+        for name, value in actual.items()
+        if value != expected[name]
+    ]
+    if snapshot.board_rect is None:
+        errors.append("board not found")
+    return errors
+
+
+def measure(grabber: Grabber, counter: RoundTripCounter, call, from_scratch, repeat) -> tuple[float, list]:
+    """Returns the round trips per call and the wall times of the calls in ms"""
+    round_trips = 0
+    times = []
+    for _ in range(repeat):
+        if from_scratch:
+            # Reset outside of the measurement
+            grabber.moves_list = {}
+            grabber.chrome.execute_script(_RESET_SCRIPT)
+        counter.count = 0
+        started = time.perf_counter()
+        call(grabber)
+        times.append((time.perf_counter() - started) * 1000)
+        round_trips += counter.count
+    return round_trips / repeat, times
+
+
+def percentile(times, p) -> float:
+    times = sorted(times)
+    return times[min(len(times) - 1, int(p / 100 * len(times)))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--site", choices=GRABBERS, action="append", help="Sites to run (all by default)")
+    parser.add_argument("--fixture", action="append", help="Fixture names to run, e.g. game (all by default)")
+    parser.add_argument("--repeat", type=int, default=20, help="Calls measured per method")
+    parser.add_argument("--devtools", action="store_true", help="Run the scripts over DevTools")
+    args = parser.parse_args()
+
+    with open(EXPECTED_PATH, encoding="utf-8") as f:
+        fixtures = json.load(f)
+
+    server = serve_fixtures()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/"
+    chrome = start_chrome()
+    debugger_address = None
+    if args.devtools:
+        debugger_address = chrome.capabilities["goog:chromeOptions"]["debuggerAddress"]
+    failures = 0
+    try:
+        for path, expected in fixtures.items():
+            name = os.path.splitext(os.path.basename(path))[0]
+            if args.site and expected["site"] not in args.site:
+                continue
+            if args.fixture and name not in args.fixture:
+                continue
+
+            chrome.get(base_url + path)
+            # Attach the grabber the same way the bot does
+            grabber = GRABBERS[expected["site"]](
+                chrome.service.service_url, chrome.session_id, debugger_address
+            )
+            if args.devtools and grabber.devtools is None:
+                parser.error("can't connect to DevTools, see the warning above")
+            counter = RoundTripCounter(grabber)
+
+            print(f"\n{path}")
+            errors = check(grabber, expected)
+            for error in errors:
+                print(f"  MISMATCH {error}")
+            failures += len(errors)
+
+            print(f"  {'call':<30} {'round trips':>11} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8}")
+            for call_name, (call, from_scratch) in CALLS.items():
+                round_trips, times = measure(grabber, counter, call, from_scratch, args.repeat)
+                print(
+                    f"  {call_name:<30} {round_trips:>11.1f} {statistics.mean(times):>9.2f}"
+                    f" {percentile(times, 50):>8.2f} {percentile(times, 95):>8.2f}"
+                )
+    finally:
+        chrome.quit()
+        server.shutdown()
+
+    if failures:
+        print(f"\n{failures} mismatches")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
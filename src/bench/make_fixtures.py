@@ -0,0 +1,303 @@
+"""
+Writes the DOM fixture pages used by the grabber harness, and the values
+the grabbers are expected to read from them, to src/bench/fixtures.
+The pages reproduce the parts of the lichess.org and chess.com markup
+that the grabbers read, without the site scripts and assets.
+Usage: python -m src.bench.make_fixtures
+"""
+import html
+import json
+import os
+import re
+
+import chess
+import chess.pgn
+
+from .fake_engine import choose_move
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+EXPECTED_PATH = os.path.join(FIXTURES_DIR, "expected.json")
+GAMES_PATH = os.path.join(BENCH_DIR, "games.pgn")
+
+# Size of the board in the pages, in pixels
+BOARD_SIZE = 640
+SQUARE_SIZE = BOARD_SIZE // 8
+
+PIECE_NAMES = {
+    chess.PAWN: "pawn",
+    chess.KNIGHT: "knight",
+    chess.BISHOP: "bishop",
+    chess.ROOK: "rook",
+    chess.QUEEN: "queen",
+    chess.KING: "king",
+}
+
+# name: (moves, player is white, page kind)
+# The page kinds are "game", "game_over" and "puzzle"
+FIXTURES = {
+    "game": (lambda games: games[0][:20], True, "game"),
+    "puzzle": (lambda games: games[1][:30], False, "puzzle"),
+    "game_over": (lambda games: games[0], True, "game_over"),
+    "long_game": (lambda games: long_game(150), False, "game"),
+}
+
+# Remaining time of white and black in the game pages, and the time control
+CLOCKS = ("2:59", "0:09.4", "3+2")
+
+
+def long_game(plies) -> list:
+    """Plays a deterministic game of the given length with the fake engine move choice"""
+    board = chess.Board()
+    for _ in range(plies):
+        board.push(choose_move(board))
+    return board.move_stack
+
+
+def read_games() -> list:
+    games = []
+    with open(GAMES_PATH, encoding="utf-8") as f:
+        while (game := chess.pgn.read_game(f)) is not None:
+            games.append(list(game.mainline_moves()))
+    return games
+
+
+def san_moves(moves) -> list:
+    board = chess.Board()
+    sans = []
+    for move in moves:
+        sans.append(board.san(move))
+        board.push(move)
+    return sans
+
+
+def final_board(moves) -> chess.Board:
+    board = chess.Board()
+    for move in moves:
+        board.push(move)
+    return board
+
+
+def parse_clock(text) -> int:
+    seconds = 0.0
+    for part in text.split(":"):
+        seconds = seconds * 60 + float(part)
+    return round(seconds * 1000)
+
+
+def lichess_page(moves, is_white, kind) -> str:
+    board = final_board(moves)
+    pieces = []
+    for square, piece in board.piece_map().items():
+        file, rank = chess.square_file(square), chess.square_rank(square)
+        x = file if is_white else 7 - file
+        y = 7 - rank if is_white else rank
+        color = "white" if piece.color else "black"
+        pieces.append(
+            f'<piece class="{color} {PIECE_NAMES[piece.piece_type]}" '
+            f'style="transform: translate({x * SQUARE_SIZE}px, {y * SQUARE_SIZE}px);"></piece>'
+        )
+    ranks = "".join(f"<coord>{r}</coord>" for r in range(1, 9))
+    files = "".join(f"<coord>{f}</coord>" for f in "abcdefgh")
+    orientation = "" if is_white else " black"
+    cg_container = (
+        f'<cg-container style="width: {BOARD_SIZE}px; height: {BOARD_SIZE}px;">'
+        f'<cg-board class="board">{"".join(pieces)}</cg-board>'
+        f'<coords class="ranks{orientation}">{ranks}</coords>'
+        f'<coords class="files{orientation}">{files}</coords>'
+        "</cg-container>"
+    )
+    sans = san_moves(moves)
+
+    if kind == "puzzle":
+        move_tags = "".join(
+            f"<move><index>{i // 2 + 1}.</index>{html.escape(san)}</move>"
+            if i % 2 == 0 else f"<move>{html.escape(san)}</move>"
+            for i, san in enumerate(sans)
+        )
+        main = (
+            '<main class="puzzle">'
+            '<aside class="puzzle__side"><div class="puzzle__side__metas">'
+            '<div class="infos puzzle"><div>'
+            "<p>Puzzle #fixture</p><p>Rating: 1500</p>"
+            "</div></div></div></aside>"
+            f'<div class="puzzle__board main-board"><div class="cg-wrap">{cg_container}</div></div>'
+            '<div class="puzzle__tools">'
+            '<div class="ceval-wrap"></div>'
+            f'<div class="puzzle__moves areplay"><div class="tview2">{move_tags}</div></div>'
+            '<div class="puzzle__feedback"><div class="play">Your turn</div></div>'
+            "</div>"
+            "</main>"
+        )
+    else:
+        move_tags = "".join(
+            (f"<i5z>{i // 2 + 1}</i5z>" if i % 2 == 0 else "") + f"<kwdb>{html.escape(san)}</kwdb>"
+            for i, san in enumerate(sans)
+        )
+        white_clock, black_clock, time_control = CLOCKS
+        status = ""
+        result = ""
+        if kind == "game_over":
+            status = '<section class="status">Checkmate • White is victorious</section>'
+            result = '<div class="result-wrap"><p class="result">1-0</p></div>'
+        main = (
+            '<main class="round">'
+            '<aside class="round__side"><div class="game__meta">'
+            f'<section><div class="setup">{time_control} • Rated • Blitz</div></section>'
+            f"{status}"
+            "</div></aside>"
+            '<div class="round__app">'
+            f'<div class="round__app__board main-board"><div class="cg-wrap">{cg_container}</div></div>'
+            f'<div class="rclock rclock-top rclock-{"black" if is_white else "white"}">'
+            f'<div class="time">{black_clock if is_white else white_clock}</div></div>'
+            f"<rm6><l4x>{move_tags}</l4x>{result}</rm6>"
+            f'<div class="rclock rclock-bottom rclock-{"white" if is_white else "black"}">'
+            f'<div class="time">{white_clock if is_white else black_clock}</div></div>'
+            "</div>"
+            "</main>"
+        )
+    return (
+        "<!DOCTYPE html>\n"
+        '<html><head><meta charset="utf-8"><title>lichess.org fixture</title>'
+        "<style>"
+        "body { margin: 0; } "
+        "cg-container, cg-board { display: block; position: relative; } "
+        "piece { position: absolute; width: 80px; height: 80px; } "
+        ".round__app, .puzzle__board { width: 640px; }"
+        "</style></head>\n"
+        f'<body><div id="top"></div><div id="main-wrap">{main}</div></body></html>\n'
+    )
+
+
+def chesscom_page(moves, is_white, kind) -> str:
+    board = final_board(moves)
+    pieces = []
+    for square, piece in board.piece_map().items():
+        file, rank = chess.square_file(square), chess.square_rank(square)
+        color = "w" if piece.color else "b"
+        pieces.append(
+            f'<div class="piece {color}{piece.symbol().lower()} square-{file + 1}{rank + 1}"></div>'
+        )
+
+    # The coordinates are laid out in a 100x100 view box like on the site,
+    # the ranks along the left edge and the files along the bottom edge
+    coordinates = []
+    for i in range(8):
+        rank = 8 - i if is_white else i + 1
+        coordinates.append(f'<text x="0.75" y="{3.5 + 12.5 * i}" font-size="2.8">{rank}</text>')
+    for i in range(8):
+        file = "abcdefgh"[i if is_white else 7 - i]
+        coordinates.append(f'<text x="{10 + 12.5 * i}" y="99" font-size="2.8">{file}</text>')
+    flipped = "" if is_white else " flipped"
+    board_html = (
+        f'<wc-chess-board id="board-single" class="board{flipped}">'
+        '<svg viewBox="0 0 100 100" class="coordinates">'
+        f'{"".join(coordinates)}</svg>'
+        f'{"".join(pieces)}'
+        "</wc-chess-board>"
+    )
+
+    nodes = []
+    board = chess.Board()
+    for i, move in enumerate(moves):
+        san = board.san(move)
+        piece = board.piece_at(move.from_square)
+        board.push(move)
+        color = "white" if i % 2 == 0 else "black"
+        # Moves of pieces, and promotions, show the piece figurine instead of its letter
+        figurine = None
+        text = san
+        if move.promotion is not None:
+            figurine = chess.piece_symbol(move.promotion).upper()
+            head, check = re.match(r"(.*=)[NBRQ](.*)", san).groups()
+            text = f'{head}<span class="icon-font-chess" data-figurine="{figurine}"></span>{check}'
+        elif piece.piece_type != chess.PAWN and not san.startswith("O-O"):
+            figurine = san[0]
+            text = f'<span class="icon-font-chess" data-figurine="{figurine}"></span>{san[1:]}'
+        node = f'<div data-ply="{i + 1}" class="{color} node">{text}</div>'
+        if i % 2 == 0:
+            nodes.append(f'<div class="move" data-whole-move-number="{i // 2 + 1}">{node}')
+        else:
+            nodes.append(f"{node}</div>")
+    if len(moves) % 2 == 1:
+        nodes.append("</div>")
+    move_list = f'<vertical-move-list>{"".join(nodes)}</vertical-move-list>'
+
+    if kind == "puzzle":
+        sidebar = f'<div class="sidebar-component"><h2>Puzzles</h2>{move_list}</div>'
+        clocks = ""
+    else:
+        white_clock, black_clock, time_control = CLOCKS
+        top, bottom = ("black", "white") if is_white else ("white", "black")
+        times = {"white": white_clock, "black": black_clock}
+        clocks = "".join(
+            f'<div class="clock-component clock-{color} clock-{position}">'
+            f'<span class="clock-time-monospace">{times[color]}</span></div>'
+            for color, position in ((top, "top"), (bottom, "bottom"))
+        )
+        minutes, increment = time_control.split("+")
+        sidebar = (
+            '<div class="sidebar-component">'
+            f'<div class="cc-time-control" data-cy="game-info-time-control">{minutes} | {increment}</div>'
+            f"{move_list}</div>"
+        )
+    modal = ""
+    if kind == "game_over":
+        modal = (
+            '<div class="board-modal-container"><div class="board-modal-component">'
+            '<div class="header-title-component">White Won</div><p>by checkmate</p>'
+            "</div></div>"
+        )
+    return (
+        "<!DOCTYPE html>\n"
+        '<html><head><meta charset="utf-8"><title>chess.com fixture</title>'
+        "<style>"
+        "body { margin: 0; } "
+        "wc-chess-board { display: block; position: relative; width: 640px; height: 640px; } "
+        "wc-chess-board svg { position: absolute; width: 100%; height: 100%; } "
+        ".piece { position: absolute; width: 80px; height: 80px; }"
+        "</style></head>\n"
+        f'<body><div id="board-layout-main">{clocks}{board_html}{modal}</div>'
+        f'<div id="board-layout-sidebar">{sidebar}</div></body></html>\n'
+    )
+
+
+def main() -> None:
+    games = read_games()
+    expected = {}
+    for site, page in (("lichess", lichess_page), ("chesscom", chesscom_page)):
+        os.makedirs(os.path.join(FIXTURES_DIR, site), exist_ok=True)
+        for name, (select_moves, is_white, kind) in FIXTURES.items():
+            moves = select_moves(games)
+            path = f"{site}/{name}.html"
+            with open(os.path.join(FIXTURES_DIR, path), "w", encoding="utf-8") as f:
+                f.write(page(moves, is_white, kind))
+
+            sans = san_moves(moves)
+            if site == "lichess":
+                # The lichess grabber drops the characters that are not letters, digits, + or -
+                sans = [re.sub(r"[^a-zA-Z0-9+-]", "", san) for san in sans]
+            clocks = None
+            if kind != "puzzle":
+                white_clock, black_clock, time_control = CLOCKS
+                increment = int(time_control.split("+")[1]) * 1000
+                clocks = [parse_clock(white_clock), parse_clock(black_clock), increment, increment]
+            expected[path] = {
+                "site": site,
+                "game_over": kind == "game_over",
+                "is_puzzles": kind == "puzzle" and site == "lichess",
+                "is_white": is_white,
+                "ply_count": len(moves),
+                "moves": sans,
+                "fen": final_board(moves).board_fen(),
+                "clocks": clocks,
+            }
+            print(f"wrote {path}")
+
+    with open(EXPECTED_PATH, "w", encoding="utf-8") as f:
+        json.dump(expected, f, indent=2)
+        f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import logging
+import time
+
+import chess
+import chess.pgn
+
+from ..grabbers.grabber import Grabber
+
+
+class ReplayGrabber(Grabber):
+    """
+    Grabber for benchmarks that needs no browser. The opponent replays the moves
+    of a PGN game, after a configurable delay. When the bot leaves the game line,
+    the opponent plays its first legal move in UCI order instead.
+    The bot moves are read from make_mouseless_move or from ReplayMouse drags.
+    Only the script calls are replaced, by answers computed from the replayed game,
+    so the page is read by the same Grabber methods as in the browser
+    """
+
+    board_rect = (0.0, 0.0, 800.0, 800.0)
+    window_offset = (0.0, 0.0)
+
+    def __init__(self, game: chess.pgn.Game, bot_is_white=True, delay=0.0, max_plies=200) -> None:
+        # No browser to attach to, only set what the base class methods use
+        self.logger = logging.getLogger(f"CAB.{self.__class__.__name__}")
+        self._board_elem = self.board_rect
+        self._move_version = None
+        # The scripts only need to be told apart, see _execute_script
+        self._snapshot_script = "snapshot"
+        self._move_list_script = "move list"
+        self._pieces_script = "pieces"
+        self._wait_script = "wait"
+        self._version = 0
+        self.delay = delay
+        self.max_plies = max_plies
+        self.load(game, bot_is_white)
+
+    def load(self, game: chess.pgn.Game, bot_is_white=True) -> None:
+        """Replaces the game in the page with a new one, like a new game or puzzle would"""
+        self.reset()
+        self.board = chess.Board()
+        self.game_moves = list(game.mainline_moves())
+        self.bot_is_white = bot_is_white
+
+        # The opponent move waiting for its delay and when it shows up
+        self._pending_move = None
+        self._pending_at = None
+        # The move list of the page in SAN, the number of moves the move list script
+        # marked as processed, and the version the page bumps on every change
+        self._page_moves = []
+        self._processed = 0
+        self._version += 1
+        self._changed_at = time.monotonic()
+
+        if not bot_is_white:
+            self._schedule_reply()
+
+    def _schedule_reply(self) -> None:
+        if self.is_game_over():
+            return
+        ply = len(self.board.move_stack)
+        move = self.game_moves[ply] if ply < len(self.game_moves) else None
+        if move is None or not self.board.is_legal(move):
+            move = min(self.board.legal_moves, key=lambda m: m.uci())
+        self._pending_move = move
+        self._pending_at = time.monotonic() + self.delay
+
+    def _push(self, move: chess.Move, changed_at: float) -> None:
+        self._page_moves.append(self.board.san(move))
+        self.board.push(move)
+        self._version += 1
+        self._changed_at = changed_at
+
+    def _release_pending_move(self) -> None:
+        # The move showed up in the page when its delay ran out, not when the bot looks,
+        # so the detection delay is counted in change_age like in the browser
+        if self._pending_move is not None and time.monotonic() >= self._pending_at:
+            self._push(self._pending_move, self._pending_at)
+            self._pending_move = None
+
+    def play(self, move: chess.Move) -> None:
+        """Plays a bot move and schedules the opponent reply"""
+        # Pieces dropped on the last rank are promoted to queens
+        if (
+            self.board.piece_type_at(move.from_square) == chess.PAWN
+            and chess.square_rank(move.to_square) in (0, 7)
+            and move.promotion is None
+        ):
+            move = chess.Move(move.from_square, move.to_square, chess.QUEEN)
+        if not self.board.is_legal(move):
+            self.logger.warning(f"illegal bot move: {move.uci()}")
+            return
+        self._push(move, time.monotonic())
+        self._schedule_reply()
+
+    def _execute_script(self, script: str, *args) -> object:
+        self._release_pending_move()
+        if script == self._snapshot_script:
+            return self._read_snapshot(*args)
+        if script == self._move_list_script:
+            return self._read_moves(*args)
+        if script == self._pieces_script:
+            return [
+                [chess.square_name(square), piece.symbol()]
+                for square, piece in self.board.piece_map().items()
+            ]
+        raise ValueError(f"unknown script: {script}")
+
+    def _execute_async_script(self, script: str, *args, timeout: float) -> object:
+        if script != self._wait_script:
+            raise ValueError(f"unknown script: {script}")
+        _, last_version, timeout_ms, find_all = args
+        # Like the page observer, return at once if the page changed since the last wait,
+        # otherwise sleep until the opponent move shows up or the timeout expires
+        self._release_pending_move()
+        if self._version == last_version and not self.is_game_over():
+            wait = timeout_ms / 1000
+            if self._pending_move is not None:
+                wait = min(wait, self._pending_at - time.monotonic())
+            time.sleep(max(0.0, wait))
+            self._release_pending_move()
+        return {
+            "version": self._version,
+            "gameOver": self.is_game_over(),
+            "snapshot": self._read_snapshot(find_all),
+        }
+
+    def _read_snapshot(self, find_all: bool) -> dict:
+        """The answer of the snapshot script"""
+        return {
+            "gameOver": self.is_game_over(),
+            "isPuzzles": False,
+            "isWhite": self.bot_is_white,
+            "boardRect": list(self.board_rect),
+            "windowOffset": list(self.window_offset),
+            "geometryVersion": 0,
+            "changeAge": (time.monotonic() - self._changed_at) * 1000,
+            "clocks": None,
+            "moves": self._read_moves(find_all),
+        }
+
+    def _read_moves(self, find_all: bool) -> dict:
+        """The answer of the move list script, which marks the moves it returns as processed"""
+        start = 0 if find_all else self._processed
+        rows = [[ply, san] for ply, san in enumerate(self._page_moves[start:], start)]
+        self._processed = len(self._page_moves)
+        return {"plies": len(self._page_moves), "rows": rows}
+
+    def _add_moves(self, rows: list) -> list:
+        new_moves = []
+        for ply, san in rows:
+            self.moves_list[ply] = san
+            new_moves.append(san)
+        return new_moves
+
+    def update_board_element(self) -> None:
+        pass
+
+    def is_white(self) -> bool:
+        return self.bot_is_white
+
+    def is_game_over(self) -> bool:
+        return self.board.is_game_over() or len(self.board.move_stack) >= self.max_plies
+
+    def is_game_puzzles(self) -> bool:
+        return False
+
+    def click_puzzle_next(self) -> None:
+        pass
+
+    def make_mouseless_move(self, move, move_count) -> None:
+        self.play(chess.Move.from_uci(move))
+
+    def square_at(self, x, y) -> int:
+        """Returns the square under the screen coordinates"""
+        square_size = self.board_rect[2] / 8
+        column = int((x - self.window_offset[0] - self.board_rect[0]) // square_size)
+        row = int((y - self.window_offset[1] - self.board_rect[1]) // square_size)
+        if self.bot_is_white:
+            return chess.square(column, 7 - row)
+        return chess.square(7 - column, row)
+
+
+class ReplayMouse:
+    """Input sink replacing pyautogui, turning drags into ReplayGrabber moves"""
+
+    def __init__(self, grabber: ReplayGrabber) -> None:
+        self.grabber = grabber
+        self.position = (0, 0)
+
+    def moveTo(self, x=None, y=None, *args, **kwargs) -> None:  # NOSONAR
+        self.position = (
+            self.position[0] if x is None else x,
+            self.position[1] if y is None else y,
+        )
+
+    def dragTo(self, x=None, y=None, *args, **kwargs) -> None:  # NOSONAR
+        start = self.position
+        self.moveTo(x, y)
+        self.grabber.play(
+            chess.Move(self.grabber.square_at(*start), self.grabber.square_at(*self.position))
+        )
+
+    def click(self, *args, **kwargs) -> None:
+        pass
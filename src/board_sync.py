@@ -0,0 +1,194 @@
+import logging
+import re
+from dataclasses import dataclass, field
+
+import chess
+
+from .uci_engine import UciEngine
+
+
+def move_key(san) -> str:
+    """
+    Returns the SAN without the characters the sites drop or format differently,
+    so the moves read from the page compare equal to the ones of the board
+    Ex. "e8=Q#" -> "e8Q", "O-O+" -> "OO"
+    """
+    return re.sub(r"[^a-zA-Z0-9]", "", san)
+
+
+@dataclass
+class SyncResult:
+    """The changes applied to the board to catch up with the page"""
+    # Number of moves taken back
+    undone: int = 0
+    # Moves played, in SAN as the page shows them
+    pushed: list = field(default_factory=list)
+    # True if the board was set to the position read from the page pieces
+    rebuilt: bool = False
+
+    def __bool__(self) -> bool:
+        return bool(self.undone or self.pushed or self.rebuilt)
+
+
+class BoardSync:
+    """
+    Keeps a board and the engine position in step with the move list of the page.
+    The move list is compared with the board ply by ply, and only the difference
+    is applied: the moves after the last common ply are taken back, for a takeback
+    or a new game in the same tab, and the moves the board misses are played.
+    When the move list can't be played, the board is set to the position
+    shown by the page pieces and only the moves that follow are played
+    """
+
+    def __init__(self, engine: UciEngine, read_fen=None) -> None:
+        """
+        Args:
+            engine: The engine kept at the position of the board
+            read_fen: Takes the side to move and returns the FEN of the page pieces,
+                or None if they can't be read, Ex. Grabber.get_fen
+        """
+        self.logger = logging.getLogger(f"CAB.{self.__class__.__name__}")
+        self.engine = engine
+        self.read_fen = read_fen
+        self.board = chess.Board()
+        # The moves of the page in SAN, the moves of the board being the last ones
+        self.moves = []
+        # move_key of every move of the board
+        self._keys = []
+        # Number of moves of the page played before the starting position of the board,
+        # and that position if it was read from the page pieces
+        self._offset = 0
+        self._root_fen = None
+        # Number of moves at the end of the board played by the bot
+        # that the page doesn't show yet
+        self._unconfirmed = 0
+
+    @property
+    def ply(self) -> int:
+        """
+        The number of plies played in the game. Unlike the move stack of the board,
+        it counts the moves before a position read from the page pieces
+        """
+        return len(self.moves)
+
+    def _clear(self) -> None:
+        self.board.reset()
+        self.moves = []
+        self._keys = []
+        self._offset = 0
+        self._root_fen = None
+        self._unconfirmed = 0
+
+    def reset(self, move_list: list) -> bool:
+        """
+        Rebuilds the board and the engine position from the whole move list,
+        or from the page pieces if the move list can't be played or doesn't
+        lead to the position they show
+        Returns False if neither can be used, leaving the starting position
+        """
+        self._clear()
+        try:
+            for san in move_list:
+                self._push_san(san)
+        except ValueError as e:
+            self.logger.warning(f"can't play the move list: {e}")
+            return self._rebuild(move_list)
+
+        # A single call checks that the moves lead to the position of the page
+        fen = self._read_fen(move_list)
+        if fen is not None and fen.split()[0] != self.board.board_fen():
+            self.logger.warning("the move list doesn't match the board pieces")
+            return self._rebuild(move_list, fen)
+        self._set_engine_position()
+        return True
+
+    def _read_fen(self, move_list: list) -> str | None:
+        if self.read_fen is None:
+            return None
+        # The side to move is the one of the move list, as the pieces don't show it
+        return self.read_fen(chess.WHITE if len(move_list) % 2 == 0 else chess.BLACK)
+
+    def _rebuild(self, move_list: list, fen: str | None = None) -> bool:
+        """Sets the board to the position of the page pieces, played after the move list"""
+        self._clear()
+        fen = fen or self._read_fen(move_list)
+        if fen is not None:
+            self.board.set_fen(fen)
+            if self.board.is_valid():
+                self.logger.debug(f"rebuilt the board from the page pieces: {fen}")
+                self.moves = list(move_list)
+                self._offset = len(move_list)
+                self._root_fen = fen
+                self._set_engine_position()
+                return True
+            self.logger.warning(f"the board pieces are not a valid position: {fen}")
+        self._clear()
+        self._set_engine_position()
+        return False
+
+    def _set_engine_position(self) -> None:
+        self.engine.set_position(
+            [move.uci() for move in self.board.move_stack], fen=self._root_fen
+        )
+
+    def push_uci(self, move: str) -> str:
+        """Plays a move of the bot on the board and the engine and returns its SAN"""
+        san = self.board.san(chess.Move.from_uci(move))
+        self._push_san(san)
+        self._unconfirmed += 1
+        self.engine.make_moves_from_current_position([move])
+        return san
+
+    def sync(self, move_list: list) -> SyncResult | None:
+        """
+        Applies the difference between the board and the move list of the page
+        Returns the changes, which are empty if the board is up to date,
+        or None if neither the move list nor the page pieces can be used
+        """
+        if len(move_list) < self._offset:
+            # Taken back before the position read from the page pieces
+            return SyncResult(rebuilt=True) if self._rebuild(move_list) else None
+        page_moves = move_list[self._offset:]
+
+        plies = len(self._keys)
+        common = 0
+        limit = min(len(page_moves), plies)
+        while common < limit and move_key(page_moves[common]) == self._keys[common]:
+            common += 1
+
+        if common == len(page_moves) and common >= plies - self._unconfirmed:
+            # Nothing new, the page may not show the last moves of the bot yet
+            self._unconfirmed = plies - common
+            return SyncResult()
+
+        undone = plies - common
+        for _ in range(undone):
+            self.board.pop()
+            self.moves.pop()
+            self._keys.pop()
+        self._unconfirmed = 0
+        if undone:
+            self.logger.debug(f"taking back {undone} moves")
+
+        pushed = page_moves[common:]
+        try:
+            for san in pushed:
+                self._push_san(san)
+        except ValueError as e:
+            # The histories diverged, a ply was missed or the game changed
+            self.logger.warning(f"can't play the move list: {e}")
+            return SyncResult(rebuilt=True) if self._rebuild(move_list) else None
+
+        if undone:
+            self._set_engine_position()
+        else:
+            # Keeps a ponder search on the opponent move
+            self.engine.make_moves_from_current_position(
+                [move.uci() for move in self.board.move_stack[common:]]
+            )
+        return SyncResult(undone, pushed)
+
+    def _push_san(self, san: str) -> None:
+        self.board.push_san(san)
+        self.moves.append(san)
+        self._keys.append(move_key(san))
@@ -0,0 +1,47 @@
+from ..utilities import char_to_num
+
+
+class BoardGeometry:
+    """
+    Screen coordinates of the centres of the 64 squares of the board,
+    precomputed for a board position, window offset and orientation
+    """
+
+    def __init__(self, board_rect, window_offset, is_white) -> None:
+        self.board_rect = board_rect
+        self.window_offset = window_offset
+        self.is_white = is_white
+
+        # Get the absolute board position
+        board_x = window_offset[0] + board_rect[0]
+        board_y = window_offset[1] + board_rect[1]
+
+        # Get the square size
+        square_size = board_rect[2] / 8
+
+        # centres[file][rank] holds the screen coordinates of a square,
+        # with file and rank counted from 0 (a1 -> centres[0][0])
+        # Depending on the player color, the board is flipped,
+        # so the coordinates need to be adjusted
+        self.centres = []
+        for file in range(8):
+            column = []
+            for rank in range(8):
+                if is_white:
+                    x = board_x + square_size * file + square_size / 2
+                    y = board_y + square_size * (7 - rank) + square_size / 2
+                else:
+                    x = board_x + square_size * (7 - file) + square_size / 2
+                    y = board_y + square_size * rank + square_size / 2
+                column.append((x, y))
+            self.centres.append(column)
+
+    # Converts a square to screen coordinates
+    # Example: "a1" -> (x, y)
+    def square_position(self, square) -> tuple:
+        return self.centres[char_to_num(square[0]) - 1][int(square[1]) - 1]
+
+    # Converts a UCI move to the screen coordinates of its start and end squares
+    # Example: "e2e4" -> ((x, y), (x, y))
+    def move_position(self, move) -> tuple[tuple, tuple]:
+        return self.square_position(move[:2]), self.square_position(move[2:4])
@@ -8,25 +8,106 @@ from .grabber import Grabber
 
 
 class ChesscomGrabber(Grabber):
-    def __init__(self, chrome_url, chrome_session_id) -> None:
-        super().__init__(chrome_url, chrome_session_id)
+    move_list_xpaths = ("//vertical-move-list",)
+    game_over_script = (
+        '() => document.getElementsByClassName("board-modal-container").length > 0'
+    )
+    board_script = """() => (
+        document.getElementById("board-vs-personalities")
+        || document.getElementById("board-single")
+    )"""
+    # Finds the square name with the smallest x and biggest y values
+    # (bottom left number) and uses it to determine the player color
+    orientation_script = """(board) => {
+        const coordinates = board.querySelector("svg.coordinates") || board.querySelector("svg");
+        if (!coordinates) return null;
+        let elem = null;
+        let minX = null;
+        let maxY = null;
+        coordinates.querySelectorAll("*").forEach((nameElement, i) => {
+            const x = parseFloat(nameElement.getAttribute("x"));
+            const y = parseFloat(nameElement.getAttribute("y"));
+            if (i === 0 || (x <= minX && y >= maxY)) {
+                minX = x;
+                maxY = y;
+                elem = nameElement;
+            }
+        });
+        return elem === null ? null : elem.textContent.trim() === "1";
+    }"""
+    # The time control is shown in the game info of the sidebar, e.g. "3 | 2"
+    clocks_script = """() => {
+        const clock = (color) => {
+            const elem = cached(`${color}Clock`, () => (
+                document.querySelector(`.clock-component.clock-${color} .clock-time-monospace`)
+                || document.querySelector(`.clock-component.clock-${color}`)
+            ));
+            return elem ? parseClock(elem.textContent) : null;
+        };
+        const timeControl = cached("timeControl", () => document.querySelector(
+            "[data-cy='game-info-time-control'], .game-info-time-control, .cc-time-control"
+        ));
+        return {
+            white: clock("white"),
+            black: clock("black"),
+            increment: timeControl ? parseIncrement(timeControl.textContent) : null,
+        };
+    }"""
+    # The pieces are <div class="piece wn square-21"> elements,
+    # the square class holding the file and the rank from 1 to 8
+    pieces_script = """(board) => {
+        const pieces = [];
+        for (const piece of board.querySelectorAll(".piece")) {
+            let type = null;
+            let square = null;
+            for (const name of piece.classList) {
+                if (/^[wb][pnbrqk]$/.test(name)) type = name;
+                const match = /^square-([1-8])([1-8])$/.exec(name);
+                if (match) square = "abcdefgh"[match[1] - 1] + match[2];
+            }
+            if (type === null || square === null) continue;
+            pieces.push([square, type[0] === "w" ? type[1].toUpperCase() : type[1]]);
+        }
+        return pieces;
+    }"""
+    # Select all children with class containing "white node" or "black node"
+    # Moves that are not pawn moves have a child holding the piece figurine
+    move_list_script = """(findAll) => {
+        const moveList = cached("moveList", () => document.querySelector("vertical-move-list"));
+        if (!moveList) return null;
+        let plies = 0;
+        const rows = [];
+        for (const move of moveList.querySelectorAll("div.move [data-ply]")) {
+            const moveClass = move.getAttribute("class") || "";
+            if (!moveClass.includes("white node") && !moveClass.includes("black node")) continue;
+            plies++;
+            if (!findAll && move.hasAttribute("data-processed")) continue;
+            const child = move.firstElementChild;
+            const figure = child ? child.getAttribute("data-figurine") : null;
+            rows.push([move.getAttribute("data-ply"), move.innerText.trim(), figure]);
+            move.setAttribute("data-processed", "true");
+        }
+        return {plies: plies, rows: rows};
+    }"""
+
+    def __init__(self, chrome_url, chrome_session_id, debugger_address=None) -> None:
+        super().__init__(chrome_url, chrome_session_id, debugger_address)
         self.logger = logging.getLogger(f"CAB.{self.__class__.__name__}")
-        self.moves_list = {}
 
     def update_board_element(self) -> None:
         self.logger.debug("Updating board element")
         try:
-            self._board_element = self.chrome.find_element(
+            self._board_elem = self.chrome.find_element(
                 By.XPATH, "//*[@id='board-vs-personalities']"
             )
         except NoSuchElementException:
             try:
-                self._board_element = self.chrome.find_element(
+                self._board_elem = self.chrome.find_element(
                     By.XPATH, "//*[@id='board-single']"
                 )
             except NoSuchElementException:
-                self._board_element = None
-        self.logger.debug(f"Updated board element: {self._board_element}")
+                self._board_elem = None
+        self.logger.debug(f"Updated board element: {self._board_elem}")
 
     def is_white(self) -> bool | None:
         # Find the square names list
@@ -81,52 +162,21 @@ class ChesscomGrabber(Grabber):
             # Return False since the game over window is not found
             return False
 
-    def get_move_list(self) -> list | None:
-        self.logger.debug("getting moves list")
-        # Find the moves list
-        try:
-            move_list_elem = self.chrome.find_element(By.TAG_NAME, "vertical-move-list")
-        except NoSuchElementException:
-            return None
-        # Select all children with class containing "white node" or "black node"
-        # Moves that are not pawn moves have a different structure
-        # containing children
-        # If the moves list is not empty, find only the new moves
-        # If the moves list is empty, find all moves
-        moves = (
-            move_list_elem.find_elements(
-                By.CSS_SELECTOR, "div.move [data-ply]:not([data-processed])"
-            )
-            if self.moves_list
-            else move_list_elem.find_elements(
-                By.CSS_SELECTOR, "div.move [data-ply]"
-            )
-        )
-        for move in moves:
-            move_class = move.get_attribute("class")
-
-            # Check if it is indeed a move
-            if "white node" not in move_class and "black node" not in move_class:
-                continue
-
-            try:
-                child = move.find_element(By.XPATH, "./*")
-                figure = child.get_attribute("data-figurine")
-            except NoSuchElementException:
-                figure = None
+    def _add_moves(self, rows: list) -> list:
+        new_moves = []
+        for ply, text, figure in rows:
             if figure is None:
-                self.moves_list[move.get_attribute("data-ply")] = move.text
-            elif "=" in move.text:
-                m = move.text + figure
-                if "+" in m:
-                    m = m.replace("+", "")
-                    m += "+"
-                self.moves_list[move.get_attribute("data-ply")] = m
+                move = text
+            elif "=" in text:
+                move = text + figure
+                if "+" in move:
+                    move = move.replace("+", "")
+                    move += "+"
             else:
-                self.moves_list[move.get_attribute("data-ply")] = figure + move.text
-            self.chrome.execute_script("arguments[0].setAttribute('data-processed', 'true')", move)
-
-        return list(self.moves_list.values())
+                move = figure + text
+            self.moves_list[ply] = move
+            new_moves.append(move)
+        return new_moves
 
     @staticmethod
     def is_game_puzzles() -> Literal[False]:
@@ -0,0 +1,131 @@
+import itertools
+import json
+import logging
+import urllib.request
+
+from selenium.common import JavascriptException, WebDriverException
+
+try:
+    import websocket
+except ImportError:
+    # The DevTools connection is optional, the grabbers then go through ChromeDriver
+    websocket = None  # NOSONAR
+
+
+class DevToolsError(WebDriverException):
+    """Raised when the DevTools connection can't be opened or is lost"""
+
+
+class DevToolsConnection:
+    """
+    Runs the scripts of the grabbers in the page over the DevTools websocket of Chrome,
+    with Runtime.evaluate, instead of sending every call through ChromeDriver.
+    The websocket stays open, so a call costs a message on the socket rather than
+    an HTTP request to ChromeDriver and a command from ChromeDriver to Chrome
+    """
+
+    def __init__(self, debugger_address: str, target_id: str, timeout: float = 10.0) -> None:
+        """
+        Args:
+            debugger_address: The host:port Chrome listens on for DevTools,
+                from the goog:chromeOptions capabilities of the session
+            target_id: The id of the page, which is the ChromeDriver window handle
+            timeout: Seconds to wait for the connection and for a call
+        Raises:
+            DevToolsError: If websocket-client is not installed or the page is not found
+        """
+        self.logger = logging.getLogger(f"CAB.{self.__class__.__name__}")
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        if websocket is None:
+            raise DevToolsError("websocket-client is not installed")
+
+        try:
+            with urllib.request.urlopen(
+                f"http://{debugger_address}/json/list", timeout=timeout
+            ) as response:
+                targets = json.load(response)
+        except (OSError, ValueError) as e:
+            raise DevToolsError(f"can't list the DevTools targets: {e}") from e
+        url = next(
+            (
+                target.get("webSocketDebuggerUrl")
+                for target in targets
+                if target.get("id") == target_id
+            ),
+            None,
+        )
+        if url is None:
+            raise DevToolsError(f"the page {target_id} is not a DevTools target")
+
+        try:
+            # Chrome rejects websocket connections from other origins
+            self._socket = websocket.create_connection(
+                url, timeout=timeout, suppress_origin=True
+            )
+        except (OSError, websocket.WebSocketException) as e:
+            raise DevToolsError(f"can't connect to {url}: {e}") from e
+        self.logger.debug(f"connected to {url}")
+
+    def _call(self, method: str, params: dict, timeout: float | None = None) -> dict:
+        """
+        Sends a DevTools command and returns its result
+        Raises:
+            DevToolsError: If the connection is lost or the call times out
+            JavascriptException: If Chrome fails the command
+        """
+        call_id = next(self._ids)
+        try:
+            self._socket.settimeout(timeout or self.timeout)
+            self._socket.send(json.dumps({"id": call_id, "method": method, "params": params}))
+            while True:
+                message = json.loads(self._socket.recv())
+                # No domain is enabled, but skip events and late replies anyway
+                if message.get("id") == call_id:
+                    break
+        except (OSError, ValueError, websocket.WebSocketException) as e:
+            raise DevToolsError(f"{method} failed: {e}") from e
+
+        if "error" in message:
+            # Ex. the page navigated while the script ran, the connection is still usable
+            raise JavascriptException(f"{method} failed: {message['error'].get('message')}")
+        return message["result"]
+
+    def _evaluate(self, expression: str, timeout: float | None, await_promise: bool) -> object:
+        result = self._call(
+            "Runtime.evaluate",
+            {
+                "expression": expression,
+                "returnByValue": True,
+                "awaitPromise": await_promise,
+            },
+            timeout,
+        )
+        details = result.get("exceptionDetails")
+        if details is not None:
+            exception = details.get("exception", {})
+            raise JavascriptException(exception.get("description") or details.get("text"))
+        return result["result"].get("value")
+
+    def execute_script(self, script: str, *args) -> object:
+        """Like WebDriver.execute_script, the arguments must be JSON values"""
+        expression = f"(function() {{\n{script}\n}}).apply(null, {json.dumps(args)})"
+        return self._evaluate(expression, None, False)
+
+    def execute_async_script(self, script: str, *args, timeout: float | None = None) -> object:
+        """
+        Like WebDriver.execute_async_script, the arguments must be JSON values
+        and the script calls its last argument with the result
+        """
+        expression = (
+            "new Promise((resolve) => (function() {\n"
+            f"{script}\n"
+            f"}}).apply(null, {json.dumps(args)}.concat([resolve])))"
+        )
+        return self._evaluate(expression, timeout, True)
+
+    def close(self) -> None:
+        try:
+            self._socket.close()
+        except (OSError, websocket.WebSocketException):
+            pass
@@ -1,31 +1,439 @@
+import logging
 from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+
+import chess
 
 from ..utilities import attach_to_session
+from .board_geometry import BoardGeometry
+from .devtools import DevToolsConnection, DevToolsError
+
+# Helpers shared by the scripts injected into the page
+_HELPERS_SCRIPT = """
+// Evaluates the XPath from the document, or from the context node
+const find = (xpath, context) => document.evaluate(
+    xpath, context || document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null
+).singleNodeValue;
+// Elements found by role, kept across calls so polling doesn't search the document
+// again. An element the page removed is no longer connected and is found again,
+// and a navigation drops the whole cache along with the window
+const elements = window.__cabElements = window.__cabElements || {};
+const cached = (role, locate) => {
+    const element = elements[role];
+    if (element && element.isConnected) return element;
+    const found = locate();
+    if (found) {
+        elements[role] = found;
+    } else {
+        delete elements[role];
+    }
+    return found;
+};
+const isGameOver = %(game_over)s;
+const isPuzzles = %(puzzles)s;
+const findBoard = () => cached("board", %(board)s);
+const isWhite = %(orientation)s;
+const readMoves = %(moves)s;
+const readPieces = %(pieces)s;
+// Converts a clock text to milliseconds
+// Ex. "1:02:03", "2:59", "0:09.4" -> 3723000, 179000, 9400
+const parseClock = (text) => {
+    if (!text) return null;
+    const parts = text.replace(/[^0-9:.]/g, "").split(":").filter((part) => part !== "");
+    if (parts.length === 0) return null;
+    const seconds = parts.reduce((total, part) => total * 60 + parseFloat(part), 0);
+    return isNaN(seconds) ? null : Math.round(seconds * 1000);
+};
+// Reads the increment in milliseconds from a time control text
+// Ex. "3+2", "3 | 2" -> 2000
+const parseIncrement = (text) => {
+    const match = /(\\d+)\\s*[+|]\\s*(\\d+)/.exec(text || "");
+    return match ? parseInt(match[2]) * 1000 : null;
+};
+const readClocks = %(clocks)s;
+// Bumps the geometry version whenever the window is resized or scrolled
+// or the board element is replaced or resized
+const geometry = window.__cabGeometry = window.__cabGeometry || {version: 0};
+const bumpGeometry = () => { geometry.version++; };
+const watchGeometry = (board) => {
+    if (!geometry.listening) {
+        window.addEventListener("resize", bumpGeometry, {passive: true});
+        window.addEventListener("scroll", bumpGeometry, {passive: true});
+        geometry.listening = true;
+    }
+    if (board && geometry.board !== board) {
+        if (geometry.observer) geometry.observer.disconnect();
+        geometry.board = board;
+        geometry.observer = new ResizeObserver(bumpGeometry);
+        geometry.observer.observe(board);
+        bumpGeometry();
+    }
+};
+const snapshot = (findAll) => {
+    const board = findBoard();
+    watchGeometry(board);
+    const rect = board ? board.getBoundingClientRect() : null;
+    const moves = readMoves(findAll);
+    return {
+        gameOver: isGameOver(),
+        isPuzzles: isPuzzles(),
+        isWhite: board ? isWhite(board) : null,
+        boardRect: rect ? [rect.left + window.scrollX, rect.top + window.scrollY, rect.width, rect.height] : null,
+        windowOffset: [
+            window.screenX + (window.outerWidth - window.innerWidth) / 2 - window.scrollX,
+            window.screenY + (window.outerHeight - window.innerHeight) - window.scrollY,
+        ],
+        geometryVersion: geometry.version,
+        changeAge: window.__cabMoves && window.__cabMoves.changedAt
+            ? Date.now() - window.__cabMoves.changedAt
+            : null,
+        clocks: readClocks(),
+        moves: moves,
+    };
+};
+"""
+
+# Returns the page state snapshot in a single call
+_SNAPSHOT_SCRIPT = _HELPERS_SCRIPT + """
+return snapshot(arguments[0]);
+"""
+
+# Returns the pieces of the board in a single call
+_PIECES_SCRIPT = _HELPERS_SCRIPT + """
+const board = findBoard();
+return board ? readPieces(board) : null;
+"""
+
+# Returns the new moves of the move list in a single call
+_MOVE_LIST_SCRIPT = _HELPERS_SCRIPT + """
+return readMoves(arguments[0]);
+"""
+
+# Installs a MutationObserver on the page (once per page load) that bumps
+# a version counter whenever the move list container changes, then waits
+# until the version differs from the last one seen, the game is over or
+# the timeout expires. The observer only listens to childList and
+# characterData mutations, so marking moves as processed doesn't wake it up
+_WAIT_FOR_MOVE_SCRIPT = _HELPERS_SCRIPT + """
+const [containerXPaths, lastVersion, timeoutMs, findAll, done] = arguments;
+// Runs on every mutation of the page, so the container is cached
+const locate = () => cached("moveListContainer", () => {
+    for (const xpath of containerXPaths) {
+        const node = find(xpath);
+        if (node) return node;
+    }
+    return null;
+});
+const state = window.__cabMoves = window.__cabMoves || {version: 0, waiters: []};
+if (!state.observer) {
+    state.container = locate();
+    state.observer = new MutationObserver((records) => {
+        const container = locate();
+        if (container !== state.container) {
+            state.container = container;
+        } else if (!container || !records.some((r) => container.contains(r.target))) {
+            return;
+        }
+        state.version++;
+        state.changedAt = Date.now();
+        state.waiters.splice(0).forEach((wake) => wake());
+    });
+    state.observer.observe(document.body, {childList: true, subtree: true, characterData: true});
+}
+const result = () => ({
+    version: state.version,
+    gameOver: isGameOver(),
+    snapshot: snapshot(findAll),
+});
+if (state.version !== lastVersion || isGameOver()) {
+    done(result());
+    return;
+}
+const started = Date.now();
+let timer = null;
+const finish = () => {
+    clearInterval(timer);
+    state.waiters = state.waiters.filter((wake) => wake !== finish);
+    done(result());
+};
+state.waiters.push(finish);
+timer = setInterval(() => {
+    if (isGameOver() || Date.now() - started >= timeoutMs) finish();
+}, 100);
+"""
+
+
+@dataclass
+class Clocks:
+    """Remaining time and increment of both sides, in milliseconds"""
+    white_time: int
+    black_time: int
+    white_increment: int = 0
+    black_increment: int = 0
+
+
+@dataclass
+class PageSnapshot:
+    """State of the page read in a single script call"""
+    game_over: bool
+    is_puzzles: bool
+    # True if white, False if black, None if the color is not found
+    is_white: bool | None
+    # x, y, width and height of the board relative to the document
+    board_rect: tuple[float, float, float, float] | None
+    # Screen coordinates of the top left corner of the page
+    window_offset: tuple[float, float]
+    # Number of plies in the page move list
+    ply_count: int
+    # Moves added since the previous snapshot
+    new_moves: list = field(default_factory=list)
+    # The whole move list, None if it is not found
+    move_list: list | None = None
+    # Bumped by the page whenever the board may have moved or been resized
+    geometry_version: int = 0
+    # The game clocks, None if they are not found
+    clocks: Clocks | None = None
+    # Seconds elapsed since the move list last changed in the page,
+    # None if the change observer is not installed yet
+    change_age: float | None = None
 
 
 # Base abstract class for different chess sites
 class Grabber(ABC):
-    def __init__(self, chrome_url, chrome_session_id) -> None:
+    # XPaths of the element containing the move list, in order of preference
+    move_list_xpaths: tuple = ()
+
+    # JavaScript functions embedded in the scripts injected into the page.
+    # They can use the find(xpath, context) helper, and the cached(role, locate)
+    # helper which keeps the element locate() returns until the page removes it
+    # Returns true if the game over window is open
+    game_over_script = "() => false"
+    # Returns true if the player does puzzles
+    puzzles_script = "() => false"
+    # Returns the board element or null
+    board_script = "() => null"
+    # Takes the board element and returns true if white, false if black
+    # and null if the color is not found
+    orientation_script = "(board) => null"
+    # Returns {white: <ms>, black: <ms>, increment: <ms>} or null if the clocks
+    # are not found. It can use the parseClock(text) and parseIncrement(text) helpers
+    clocks_script = "() => null"
+    # Takes a boolean telling whether to return all moves or only the ones
+    # not processed yet, marks them as processed and returns
+    # {plies: <number of plies>, rows: [[ply, ...], ...]},
+    # or null if the move list is not found
+    move_list_script = "(findAll) => null"
+    # Takes the board element and returns the pieces on it as [[square, symbol], ...]
+    # with the square name and the FEN letter of the piece, Ex. ["e4", "P"],
+    # or null if they are not found. It can use the isWhite(board) helper
+    pieces_script = "(board) => null"
+
+    def __init__(self, chrome_url, chrome_session_id, debugger_address=None) -> None:
+        self.logger = logging.getLogger(f"CAB.{self.__class__.__name__}")
         self.chrome = attach_to_session(chrome_url, chrome_session_id)
+        # The scripts run over the DevTools websocket of the page if its address is given
+        # and it can be reached, otherwise through ChromeDriver
+        self.devtools = None
+        if debugger_address is not None:
+            try:
+                self.devtools = DevToolsConnection(
+                    debugger_address, self.chrome.current_window_handle
+                )
+            except DevToolsError as e:
+                self.logger.warning(f"running the scripts through ChromeDriver: {e.msg}")
         self._board_elem = None
+        self._move_version = None
+        self._script_timeout = None
+        self.moves_list = {}
+        self.last_snapshot = None
+        self._geometry = None
+        self._geometry_key = None
+
+        helpers = {
+            "game_over": self.game_over_script,
+            "puzzles": self.puzzles_script,
+            "board": self.board_script,
+            "orientation": self.orientation_script,
+            "clocks": self.clocks_script,
+            "moves": self.move_list_script,
+            "pieces": self.pieces_script,
+        }
+        self._snapshot_script = _SNAPSHOT_SCRIPT % helpers
+        self._move_list_script = _MOVE_LIST_SCRIPT % helpers
+        self._pieces_script = _PIECES_SCRIPT % helpers
+        self._wait_script = _WAIT_FOR_MOVE_SCRIPT % helpers
+
+    # Runs the script over DevTools, or through ChromeDriver if it isn't connected
+    # If the DevTools connection is lost, ChromeDriver is used from then on
+    def _execute_script(self, script: str, *args) -> object:
+        if self.devtools is not None:
+            try:
+                return self.devtools.execute_script(script, *args)
+            except DevToolsError as e:
+                self._drop_devtools(e)
+        return self.chrome.execute_script(script, *args)
+
+    def _execute_async_script(self, script: str, *args, timeout: float) -> object:
+        if self.devtools is not None:
+            try:
+                return self.devtools.execute_async_script(script, *args, timeout=timeout)
+            except DevToolsError as e:
+                self._drop_devtools(e)
+        if self._script_timeout is None or self._script_timeout < timeout:
+            self._script_timeout = timeout
+            self.chrome.set_script_timeout(self._script_timeout)
+        return self.chrome.execute_async_script(script, *args)
+
+    def _drop_devtools(self, error: DevToolsError) -> None:
+        self.logger.warning(f"running the scripts through ChromeDriver: {error.msg}")
+        self.devtools.close()
+        self.devtools = None
 
     def get_board(self) -> None:
         return self._board_elem
 
     # Returns the coordinates of the top left corner of the ChromeDriver
     def get_top_left_corner(self) -> tuple:
-        canvas_x_offset = self.chrome.execute_script(
+        canvas_x_offset = self._execute_script(
             "return window.screenX + (window.outerWidth - window.innerWidth) / 2 - window.scrollX;"
         )
-        canvas_y_offset = self.chrome.execute_script(
+        canvas_y_offset = self._execute_script(
             "return window.screenY + (window.outerHeight - window.innerHeight) - window.scrollY;"
         )
         return canvas_x_offset, canvas_y_offset
 
+    # Returns the current board move list
+    # Ex. ["e4", "c5", "Nf3"]
+    # Returns None if the move list is not found
+    def get_move_list(self) -> list | None:
+        # If the moves list is empty, find all moves
+        moves = self._execute_script(self._move_list_script, not self.moves_list)
+        if moves is None:
+            return None
+        self._add_moves(moves["rows"])
+        self._trim_moves(moves["plies"])
+        return list(self.moves_list.values())
+
+    # Forgets the moves read so far and the cached board geometry,
+    # so the next read returns the whole move list of the page
+    # Used when a new game or puzzle may have replaced the previous one
+    def reset(self) -> None:
+        self.moves_list = {}
+        self.last_snapshot = None
+        self._geometry = None
+        self._geometry_key = None
+
+    # Returns the FEN of the position shown by the board pieces, read in a single
+    # script call, or None if the board is not found
+    # The board doesn't show the side to move, which is given by turn.
+    # The castling rights are the ones the king and rook squares still allow,
+    # and en passant is never set
+    def get_fen(self, turn: bool = chess.WHITE) -> str | None:
+        pieces = self._execute_script(self._pieces_script)
+        if pieces is None:
+            return None
+        board = chess.Board.empty()
+        for square, symbol in pieces:
+            board.set_piece_at(chess.parse_square(square), chess.Piece.from_symbol(symbol))
+        board.turn = turn
+        board.set_castling_fen("KQkq")
+        board.castling_rights = board.clean_castling_rights()
+        return board.fen()
+
+    # Reads the game over state, puzzle mode, orientation, board position,
+    # window offset and new moves in a single script call
+    # If wait is given, first blocks for up to wait seconds
+    # until the move list changes or the game is over
+    def snapshot(self, wait: float | None = None) -> PageSnapshot:
+        find_all = not self.moves_list
+        if wait is None:
+            result = self._execute_script(self._snapshot_script, find_all)
+        else:
+            result = self._wait_for_move_change(wait, find_all)["snapshot"]
+
+        moves = result["moves"]
+        new_moves = []
+        if moves is not None:
+            new_moves = self._add_moves(moves["rows"])
+            self._trim_moves(moves["plies"])
+        self.last_snapshot = PageSnapshot(
+            game_over=result["gameOver"],
+            is_puzzles=result["isPuzzles"],
+            is_white=result["isWhite"],
+            board_rect=None if result["boardRect"] is None else tuple(result["boardRect"]),
+            window_offset=tuple(result["windowOffset"]),
+            ply_count=0 if moves is None else moves["plies"],
+            new_moves=new_moves,
+            move_list=None if moves is None else list(self.moves_list.values()),
+            geometry_version=result["geometryVersion"],
+            clocks=self._parse_clocks(result["clocks"]),
+            change_age=None if result["changeAge"] is None else result["changeAge"] / 1000,
+        )
+        return self.last_snapshot
+
+    @staticmethod
+    def _parse_clocks(clocks) -> Clocks | None:
+        if clocks is None or clocks["white"] is None or clocks["black"] is None:
+            return None
+        increment = clocks["increment"] or 0
+        return Clocks(clocks["white"], clocks["black"], increment, increment)
+
+    # Returns the screen geometry of the board, None if the board is not found
+    # The geometry is cached and only rebuilt when the page reports a resize,
+    # a scroll or a new board, when the board moves in the page (Ex. a banner loads
+    # above it), when the window moves or the orientation changes
+    def get_geometry(self) -> BoardGeometry | None:
+        snapshot = self.last_snapshot or self.snapshot()
+        if snapshot.board_rect is None:
+            return None
+
+        key = (
+            snapshot.geometry_version,
+            snapshot.board_rect,
+            snapshot.window_offset,
+            snapshot.is_white,
+        )
+        if key != self._geometry_key:
+            self._geometry = BoardGeometry(
+                snapshot.board_rect, snapshot.window_offset, snapshot.is_white
+            )
+            self._geometry_key = key
+        return self._geometry
+
+    # Blocks until the move list changes, the game is over or the timeout expires,
+    # then returns the page version, the game over state and the page snapshot
+    def _wait_for_move_change(self, timeout: float, find_all: bool) -> dict:
+        # The page gives up after the timeout, leave it a second to answer
+        result = self._execute_async_script(
+            self._wait_script,
+            list(self.move_list_xpaths),
+            self._move_version,
+            int(timeout * 1000),
+            find_all,
+            timeout=timeout + 1,
+        )
+        self._move_version = result["version"]
+        return result
+
+    # Drops the moves the page no longer shows, after a takeback
+    # The page only reports the moves it adds, so a shorter move list
+    # is only noticed through its number of plies
+    def _trim_moves(self, plies: int) -> None:
+        if len(self.moves_list) <= plies:
+            return
+        kept = sorted(self.moves_list, key=int)[:plies]
+        self.moves_list = {ply: self.moves_list[ply] for ply in kept}
+
+    # Adds the rows returned by move_list_script to moves_list
+    # Returns the moves that were added
+    @abstractmethod
+    def _add_moves(self, rows: list) -> list:
+        pass
+
     # Sets the _board_elem variable
     @staticmethod
     @abstractmethod
-    def update_board_elem() -> None:
+    def update_board_element() -> None:
         pass
 
     # Returns True if white, False if black,
@@ -42,13 +450,6 @@ class Grabber(ABC):
     def is_game_over() -> None:
         pass
 
-    # Returns the current board move list
-    # Ex. ["e4", "c5", "Nf3"]
-    @staticmethod
-    @abstractmethod
-    def get_move_list() -> None:
-        pass
-
     # Returns True if the player does puzzles
     # and False if not
     @staticmethod
@@ -3,17 +3,120 @@ import re
 
 from selenium.common import NoSuchElementException
 from selenium.webdriver.common.by import By
-from selenium.webdriver.remote.webelement import WebElement
 
 from .grabber import Grabber
 
 
 class LichessGrabber(Grabber):
-    def __init__(self, chrome_url, chrome_session_id) -> None:
-        super().__init__(chrome_url, chrome_session_id)
+    move_list_xpaths = (
+        '//*[@id="main-wrap"]/main/div[1]/rm6/l4x',
+        '//*[@id="main-wrap"]/main/div[1]/rm6',
+        "/html/body/div[2]/main/div[2]/div[2]/div",
+    )
+    # The elements of the game page are looked up from the cached #main-wrap element
+    # instead of searching the whole document for its id on every call
+    game_over_script = """() => {
+        const wrap = cached("mainWrap", () => document.getElementById("main-wrap"));
+        if (wrap && find("./main/aside/div/section[2]", wrap)) return true;
+        const puzzle = cached(
+            "puzzleFeedback", () => find("/html/body/div[2]/main/div[2]/div[3]/div[1]")
+        );
+        return puzzle !== null && puzzle.getAttribute("class") === "complete";
+    }"""
+    puzzles_script = """() => cached(
+        "puzzleInfo", () => find("/html/body/div[2]/main/aside/div[1]/div[1]/div/p[1]")
+    ) !== null"""
+    # Try finding the normal board, then the board in the puzzles page
+    board_script = """() => {
+        const wrap = cached("mainWrap", () => document.getElementById("main-wrap"));
+        return (wrap && find("./main/div[1]/div[1]/div/cg-container", wrap))
+            || find("/html/body/div[2]/main/div[1]/div/cg-container");
+    }"""
+    orientation_script = """(board) => {
+        const ranks = Array.from(board.children).find(
+            (child) => (child.getAttribute("class") || "").includes("ranks")
+        );
+        return ranks ? ranks.getAttribute("class") === "ranks" : null;
+    }"""
+    # The pieces are <piece class="white knight"> elements, which chessground
+    # places with a translate transform from the top left corner of the board
+    # and tags with their square in the cgKey property
+    # Dragged piece copies and captured pieces fading out are skipped
+    pieces_script = """(board) => {
+        const cgBoard = board.querySelector("cg-board");
+        const white = isWhite(board);
+        if (!cgBoard || white === null) return null;
+        const size = cgBoard.getBoundingClientRect().width / 8;
+        const letters = {pawn: "p", knight: "n", bishop: "b", rook: "r", queen: "q", king: "k"};
+        const pieces = [];
+        for (const piece of cgBoard.querySelectorAll("piece")) {
+            const classes = piece.classList;
+            if (classes.contains("ghost") || classes.contains("fading")) continue;
+            const type = Object.keys(letters).find((name) => classes.contains(name));
+            if (!type) continue;
+            let square = piece.cgKey;
+            if (!square) {
+                const match = /translate\\((-?[\\d.]+)px,\\s*(-?[\\d.]+)px\\)/.exec(piece.style.transform);
+                if (!match) continue;
+                const column = Math.round(parseFloat(match[1]) / size);
+                const row = Math.round(parseFloat(match[2]) / size);
+                square = "abcdefgh"[white ? column : 7 - column] + (white ? 8 - row : row + 1);
+            }
+            const letter = letters[type];
+            pieces.push([square, classes.contains("white") ? letter.toUpperCase() : letter]);
+        }
+        return pieces;
+    }"""
+    # The time control is shown in the game info of the sidebar, e.g. "3+2 • Rated • Blitz"
+    clocks_script = """() => {
+        const clock = (color) => {
+            const elem = cached(
+                `${color}Clock`, () => document.querySelector(`.rclock-${color} .time`)
+            );
+            return elem ? parseClock(elem.textContent) : null;
+        };
+        const setup = cached("setup", () => document.querySelector(".game__meta .setup"));
+        return {
+            white: clock("white"),
+            black: clock("black"),
+            increment: setup ? parseIncrement(setup.textContent) : null,
+        };
+    }"""
+    # On the normal page the moves are the children sharing the tag name of
+    # the last child of the moves list, on the puzzles page they are <move> tags
+    move_list_script = """(findAll) => {
+        let moveList = null;
+        let tagName = "move";
+        if (isPuzzles()) {
+            moveList = cached(
+                "puzzleMoveList", () => find("/html/body/div[2]/main/div[2]/div[2]/div")
+            );
+            if (!moveList) return null;
+        } else {
+            const wrap = cached("mainWrap", () => document.getElementById("main-wrap"));
+            moveList = cached("moveList", () => wrap && find("./main/div[1]/rm6/l4x", wrap));
+            if (!moveList) {
+                // The moves list container exists before the first move is made
+                const empty = {plies: 0, rows: []};
+                return wrap && find("./main/div[1]/rm6", wrap) ? empty : null;
+            }
+            if (!moveList.lastElementChild) return {plies: 0, rows: []};
+            tagName = moveList.lastElementChild.tagName.toLowerCase();
+        }
+        let plies = 0;
+        const rows = [];
+        moveList.querySelectorAll(tagName).forEach((move, ply) => {
+            if (move.innerText.replace(/[^a-zA-Z0-9+-]/g, "") !== "") plies++;
+            if (!findAll && move.hasAttribute("data-processed")) return;
+            rows.push([ply, move.innerText]);
+            move.setAttribute("data-processed", "true");
+        });
+        return {plies: plies, rows: rows};
+    }"""
+
+    def __init__(self, chrome_url, chrome_session_id, debugger_address=None) -> None:
+        super().__init__(chrome_url, chrome_session_id, debugger_address)
         self.logger = logging.getLogger(f"CAB.{self.__class__.__name__}")
-        self.tag_name = None
-        self.moves_list = {}
 
     def update_board_element(self) -> None:
         self.logger.debug("updating board element")
@@ -59,108 +162,15 @@ class LichessGrabber(Grabber):
             except NoSuchElementException:
                 return False
 
-    def set_moves_tag_name(self) -> bool:
-        self.logger.debug("setting moves tag name")
-        if self.is_game_puzzles():
-            return False
-
-        move_list_elem = self.get_normal_move_list_element()
-
-        if move_list_elem is None or move_list_elem == []:
-            return False
-
-        try:
-            last_child = move_list_elem.find_element(By.XPATH, "*[last()]")
-            self.tag_name = last_child.tag_name
-
-            return True
-        except NoSuchElementException:
-            return False
-
-    def get_move_list(self) -> list | None:
-        self.logger.debug("getting moves list")
-        is_puzzles = self.is_game_puzzles()
-        # Find the move list element
-        if is_puzzles:
-            move_list_element = self.get_puzzles_move_list_element()
-            if not move_list_element:
-                return None
-        else:
-            move_list_element = self.get_normal_move_list_element()
-            if not move_list_element:
-                return None
-            if (
-                self.tag_name is None 
-                and self.set_moves_tag_name() is False
-            ):
-                return []
-        self.get_move_element(move_list_element, is_puzzles)
-
-    def get_move_element(self, move_list_element: WebElement, is_puzzles: bool) -> list | None:
-        # Get the move elements (children of the move list element)
-        self.logger.debug("getting move element")
-        try:
-            if not is_puzzles:
-                children = (
-                    move_list_element.find_elements(
-                        By.CSS_SELECTOR, f"{self.tag_name}:not([data-processed])"
-                    )
-                    if self.moves_list
-                    else move_list_element.find_elements(
-                        By.CSS_SELECTOR, self.tag_name
-                    )
-                )
-            else:
-                children = (
-                    move_list_element.find_elements(
-                        By.CSS_SELECTOR, "move:not([data-processed])"
-                    )
-                    if self.moves_list
-                    else move_list_element.find_elements(By.CSS_SELECTOR, "move")
-                )
-        except NoSuchElementException:
-            return None
-
-        # Get the moves from the elements
-        for move_element in children:
+    def _add_moves(self, rows: list) -> list:
+        new_moves = []
+        for ply, text in rows:
             # Sanitize the move
-            move = re.sub(r"[^a-zA-Z0-9+-]", "", move_element.text)
+            move = re.sub(r"[^a-zA-Z0-9+-]", "", text)
             if move != "":
-                self.moves_list[move_element.id] = move
-
-            # Mark the move as processed
-            self.chrome.execute_script(
-                "arguments[0].setAttribute('data-processed', 'true')", move_element
-            )
-
-        return list(self.moves_list.values())
-
-    def get_puzzles_move_list_element(self) -> WebElement | None:
-        self.logger.debug("getting puzzles move list element")
-        try:
-            return self.chrome.find_element(
-                By.XPATH, "/html/body/div[2]/main/div[2]/div[2]/div"
-            )
-        except NoSuchElementException:
-            return None
-
-    def get_normal_move_list_element(self) -> WebElement | list | None:
-        self.logger.debug("getting normal move list element")
-        try:
-            return self.chrome.find_element(
-                By.XPATH, '//*[@id="main-wrap"]/main/div[1]/rm6/l4x'
-            )
-        except NoSuchElementException:
-            try:
-                # Try finding the normal move list when there are no moves yet
-                self.chrome.find_element(
-                    By.XPATH, '//*[@id="main-wrap"]/main/div[1]/rm6'
-                )
-
-                # If we don't have an exception at this point, we don't have any moves yet
-                return []
-            except NoSuchElementException:
-                return None
+                self.moves_list[ply] = move
+                new_moves.append(move)
+        return new_moves
 
     def is_game_puzzles(self) -> bool:
         self.logger.debug("checking if games are puzzles")
@@ -199,4 +209,4 @@ class LichessGrabber(Grabber):
             '{"t":"move","d":{"u":"' + move + '","b":1,"a":' + str(move_count) + "}}"
         )
         script = f"lichess.socket.ws.send(JSON.stringify({message}))"
-        self.chrome.execute_script(script)
+        self._execute_script(script)
@@ -1,4 +1,5 @@
 import logging
+import math
 import threading
 import time
 import tkinter as tk
@@ -6,15 +7,44 @@ from tkinter import filedialog, ttk
 
 import keyboard
 import multiprocess
+import multiprocess.connection
 from selenium import webdriver
 from selenium.common import WebDriverException
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 
 from .overlay import run
+from .protocol import (
+    Arrows,
+    Channel,
+    Error,
+    ErrorCode,
+    Eval,
+    Moves,
+    Overlay,
+    OverlayCode,
+    ProtocolError,
+    Startup,
+    Status,
+    StatusCode,
+    Timing,
+    decode,
+)
 from .stockfish_bot import StockfishBot
 
 open_browser_text = "Open Browser"
+position_store_path = "positions.sqlite"
+# Error dialog text of the Stockfish Bot errors
+error_messages = {
+    ErrorCode.ENGINE_NOT_FOUND: "Stockfish path provided is not valid!",
+    ErrorCode.ENGINE_NOT_EXECUTABLE: "Stockfish path provided is not executable!",
+    ErrorCode.BOARD_NOT_FOUND: "Cant find board!",
+    ErrorCode.COLOR_NOT_FOUND: "Cant find player color!",
+    ErrorCode.MOVES_NOT_FOUND: "Cant find moves list!",
+    ErrorCode.GAME_OVER: "Game has already finished!",
+}
+# Seconds between the checks of whether the browser window was closed
+browser_check_interval = 0.5
 
 class GUI:
     def __init__(self, master: tk.Tk) -> None:
@@ -31,20 +61,33 @@ class GUI:
         # self.stockfish_bot = None
         self.chrome_url = None
         self.chrome_session_id = None
+        # host:port of the DevTools endpoint of the Chrome opened by the driver
+        self.chrome_debugger_address = None
 
         # Used for the communication between the GUI
         # and the Stockfish Bot process
         self.stockfish_bot_pipe = None
-        self.overlay_screen_pipe = None
 
         # The Stockfish Bot process
         self.stockfish_bot_process = None
+
+        # The overlay process, started once and reused across games,
+        # and the channel used for sending it commands and arrows
         self.overlay_screen_process = None
-        self.restart_after_stopping = False
+        self.overlay_screen_channel = None
+        # Held while checking that arrows come from the running bot and sending them,
+        # so the arrows of a stopped bot can't be sent after the overlay is cleared
+        self.overlay_lock = threading.Lock()
 
         # Used for storing the match moves
         self.match_moves = []
 
+        # The number of plies in the moves Treeview, the id of its last row
+        # and whether scrolling it to the last move is scheduled
+        self.tree_ply_count = 0
+        self.tree_last_row = None
+        self.tree_scroll_scheduled = False
+
         # Set the window properties
         master.title("Chess")
         master.geometry("")
@@ -127,6 +170,20 @@ class GUI:
         )
         self.non_stop_puzzles_check_button.pack(anchor=tk.NW)
 
+        # Create the persistent analysis check button
+        self.enable_position_store = tk.IntVar(value=0)
+        self.position_store_check_button = tk.Checkbutton(
+            left_frame, text="Persistent analysis", variable=self.enable_position_store
+        )
+        self.position_store_check_button.pack(anchor=tk.NW)
+
+        # Create the DevTools connection check button
+        self.enable_devtools = tk.IntVar(value=0)
+        self.devtools_check_button = tk.Checkbutton(
+            left_frame, text="DevTools connection", variable=self.enable_devtools
+        )
+        self.devtools_check_button.pack(anchor=tk.NW)
+
         # Create the bongcloud check button
         self.enable_bongcloud = tk.IntVar()
         self.bongcloud_check_button = tk.Checkbutton(
@@ -181,6 +238,17 @@ class GUI:
         self.stockfish_depth_scale.pack()
         stockfish_depth_frame.pack(anchor=tk.NW)
 
+        # Create the move time entry field
+        move_time_frame = tk.Frame(left_frame)
+        tk.Label(move_time_frame, text="Max Move Time").pack(side=tk.LEFT)
+        self.move_time = tk.IntVar(value=0)
+        self.move_time_entry = tk.Entry(
+            move_time_frame, textvariable=self.move_time, justify="center", width=6
+        )
+        self.move_time_entry.pack(side=tk.LEFT)
+        tk.Label(move_time_frame, text="ms").pack()
+        move_time_frame.pack(anchor=tk.NW)
+
         # Create the memory entry field
         memory_frame = tk.Frame(left_frame)
         tk.Label(memory_frame, text="Memory").pack(side=tk.LEFT)
@@ -190,7 +258,18 @@ class GUI:
         )
         self.memory_entry.pack(side=tk.LEFT)
         tk.Label(memory_frame, text="MB").pack()
-        memory_frame.pack(anchor=tk.NW, pady=(0, 15))
+        memory_frame.pack(anchor=tk.NW)
+
+        # Create the analysis cache memory entry field
+        cache_memory_frame = tk.Frame(left_frame)
+        tk.Label(cache_memory_frame, text="Cache").pack(side=tk.LEFT)
+        self.cache_memory = tk.IntVar(value=16)
+        self.cache_memory_entry = tk.Entry(
+            cache_memory_frame, textvariable=self.cache_memory, justify="center", width=11
+        )
+        self.cache_memory_entry.pack(side=tk.LEFT)
+        tk.Label(cache_memory_frame, text="MB").pack()
+        cache_memory_frame.pack(anchor=tk.NW, pady=(0, 15))
 
         # Create the CPU threads entry field
         cpu_threads_frame = tk.Frame(left_frame)
@@ -235,6 +314,50 @@ class GUI:
         self.stockfish_path_text = tk.Label(left_frame, text="", wraplength=180)
         self.stockfish_path_text.pack(anchor=tk.NW)
 
+        # Create the select opening book button
+        self.book_path = ""
+        self.select_book_button = tk.Button(
+            left_frame,
+            text="Select Opening Book",
+            command=self.on_select_book_button_listener,
+        )
+        self.select_book_button.pack(anchor=tk.NW)
+
+        # Create the opening book path text
+        self.book_path_text = tk.Label(left_frame, text="", wraplength=180)
+        self.book_path_text.pack(anchor=tk.NW)
+
+        # Create the book depth entry field
+        book_max_ply_frame = tk.Frame(left_frame)
+        tk.Label(book_max_ply_frame, text="Book Depth").pack(side=tk.LEFT)
+        self.book_max_ply = tk.IntVar(value=16)
+        self.book_max_ply_entry = tk.Entry(
+            book_max_ply_frame, textvariable=self.book_max_ply, justify="center", width=6
+        )
+        self.book_max_ply_entry.pack(side=tk.LEFT)
+        tk.Label(book_max_ply_frame, text="plies").pack()
+        book_max_ply_frame.pack(anchor=tk.NW)
+
+        # Create the best book move check button
+        self.enable_book_best_move = tk.IntVar(value=0)
+        self.book_best_move_check_button = tk.Checkbutton(
+            left_frame, text="Best book move", variable=self.enable_book_best_move
+        )
+        self.book_best_move_check_button.pack(anchor=tk.NW)
+
+        # Create the select syzygy button
+        self.syzygy_path = ""
+        self.select_syzygy_button = tk.Button(
+            left_frame,
+            text="Select Syzygy Tablebases",
+            command=self.on_select_syzygy_button_listener,
+        )
+        self.select_syzygy_button.pack(anchor=tk.NW)
+
+        # Create the syzygy path text
+        self.syzygy_path_text = tk.Label(left_frame, text="", wraplength=180)
+        self.syzygy_path_text.pack(anchor=tk.NW)
+
         left_frame.grid(row=0, column=0, padx=5, sticky=tk.NW)
 
         # Right frame
@@ -276,158 +399,219 @@ class GUI:
         )
         self.export_pgn_button.pack(anchor=tk.NW, fill=tk.X)
 
-        right_frame.grid(row=0, column=1, sticky=tk.NW)
+        # Create the move latency text
+        self.latency_text = tk.Label(right_frame, text="")
+        self.latency_text.pack(anchor=tk.NW)
 
-        # Start the process checker thread
-        process_checker_thread = threading.Thread(target=self.process_checker_thread)
-        process_checker_thread.start()
+        # Create the time to first move text
+        self.startup_text = tk.Label(right_frame, text="")
+        self.startup_text.pack(anchor=tk.NW)
 
-        # Start the browser checker thread
-        browser_checker_thread = threading.Thread(target=self.browser_checker_thread)
-        browser_checker_thread.start()
+        # Create the evaluation text
+        self.eval_text = tk.Label(right_frame, text="")
+        self.eval_text.pack(anchor=tk.NW)
 
-        # Start the process communicator thread
-        process_communicator_thread = threading.Thread(
-            target=self.process_communicator_thread
-        )
-        process_communicator_thread.start()
+        right_frame.grid(row=0, column=1, sticky=tk.NW)
 
-        # Start the keyboard listener thread
-        keyboard_listener_thread = threading.Thread(
-            target=self.keypress_listener_thread
-        )
-        keyboard_listener_thread.start()
+        # Used for waking up the dispatcher thread when the watched pipe
+        # or process changes, or when the GUI is closed
+        self.wakeup_reader, self.wakeup_writer = multiprocess.Pipe(duplex=False)
+
+        # Start the dispatcher thread
+        dispatcher_thread = threading.Thread(target=self.dispatcher_thread)
+        dispatcher_thread.start()
+
+        # Start and stop hotkeys
+        keyboard.add_hotkey("1", lambda: self.master.after(0, self.on_start_hotkey_listener))
+        keyboard.add_hotkey("2", lambda: self.master.after(0, self.on_stop_hotkey_listener))
 
     # Detects if the user pressed the close button
     def on_close_listener(self) -> None:
         self.logger.debug("close button pressed")
-        # Set self.exit to True so that the threads will stop
+        # Set self.exit to True so that the dispatcher thread will stop
         self.exit = True
+        self.wake_dispatcher()
+        keyboard.unhook_all_hotkeys()
+        self.stop_overlay()
         self.master.destroy()
 
-    # Detects if the Stockfish Bot process is running
-    def process_checker_thread(self) -> None:
-        self.logger.debug("checking stockfish process")
+    # Wakes up the dispatcher thread so that it watches the current pipe and process
+    def wake_dispatcher(self) -> None:
+        try:
+            self.wakeup_writer.send(None)
+        except OSError:
+            pass
+
+    # Waits for messages from the Stockfish Bot process, for the process to exit
+    # and for the wakeup pipe, and hands them over to the Tk thread with after()
+    # The browser is checked every browser_check_interval seconds while it is open,
+    # even if messages keep coming, otherwise the thread sleeps until something happens
+    def dispatcher_thread(self) -> None:
+        self.logger.debug("starting dispatcher")
+        # The pipe and process that have already been reported as closed
+        closed_pipe = None
+        exited_process = None
+        next_browser_check = time.monotonic()
         while not self.exit:
+            pipe = self.stockfish_bot_pipe
+            process = self.stockfish_bot_process
+            watched = [self.wakeup_reader]
+            if pipe is not None and pipe is not closed_pipe:
+                watched.append(pipe)
+            if process is not None and process is not exited_process:
+                try:
+                    watched.append(process.sentinel)
+                except ValueError:
+                    # The process is not started yet, the Tk thread wakes us up once it is
+                    process = None
+            timeout = None
+            if self.opened_browser:
+                timeout = max(0.0, next_browser_check - time.monotonic())
+
+            try:
+                ready = multiprocess.connection.wait(watched, timeout)
+            except (OSError, ValueError):
+                # The pipe was closed by the Tk thread while waiting
+                closed_pipe = pipe
+                continue
+
+            if self.wakeup_reader in ready:
+                while self.wakeup_reader.poll():
+                    self.wakeup_reader.recv()
+
+            if pipe is not None and pipe in ready:
+                # Read everything that is available and dispatch it at once
+                messages = []
+                try:
+                    while pipe.poll():
+                        messages += decode(pipe.recv_bytes())
+                except ProtocolError as e:
+                    self.logger.warning(f"dropping bot message: {e}")
+                except (OSError, EOFError, ValueError):
+                    # The Stockfish Bot process closed its end or the pipe was closed
+                    closed_pipe = pipe
+                # Forward only the latest arrows to the overlay, right away
+                arrows = [message for message in messages if isinstance(message, Arrows)]
+                if arrows:
+                    self.send_overlay(arrows[-1], pipe=pipe)
+                    messages = [message for message in messages if not isinstance(message, Arrows)]
+                if messages:
+                    self.master.after(0, self.on_bot_messages, pipe, messages)
+
+            if process is not None and process.sentinel in ready:
+                exited_process = process
+                self.master.after(0, self.on_bot_process_exit, process)
+
+            # A steady stream of eval updates never lets the wait time out,
+            # so the browser check is due by time rather than on timeouts
+            if self.opened_browser and time.monotonic() >= next_browser_check:
+                self.check_browser()
+                next_browser_check = time.monotonic() + browser_check_interval
+
+    # Detects if the Selenium Chromedriver window was closed
+    def check_browser(self) -> None:
+        try:
             if (
-                self.running
-                and self.stockfish_bot_process is not None
-                and not self.stockfish_bot_process.is_alive()
+                self.opened_browser
+                and self.chrome is not None
+                and "target window already closed"
+                in self.chrome.get_log("driver")[-1]["message"]
             ):
-                self.on_stop_button_listener()
+                self.master.after(0, self.on_browser_closed)
+        except (IndexError, WebDriverException):
+            pass
 
-                # Restart the process if restart_after_stopping is True
-                if self.restart_after_stopping:
-                    self.restart_after_stopping = False
-                    self.on_start_button_listener()
-            time.sleep(0.1)
+    def on_browser_closed(self) -> None:
+        if not self.opened_browser:
+            return
+        self.opened_browser = False
 
-    # Detects if Selenium Chromedriver is running
-    def browser_checker_thread(self) -> None:
-        self.logger.debug("checking browser process")
-        while not self.exit:
-            try:
-                if (
-                    self.opened_browser
-                    and self.chrome is not None
-                    and "target window already closed"
-                    in self.chrome.get_log("driver")[-1]["message"]
-                ):
-                    self.opened_browser = False
-
-                    # Set Opening Browser button state to closed
-                    self.open_browser_button["text"] = open_browser_text
-                    self.open_browser_button["state"] = "normal"
-                    self.open_browser_button.update()
-
-                    self.on_stop_button_listener()
-                    self.chrome = None
-            except IndexError:
-                pass
-            time.sleep(0.1)
-
-    # Responsible for communicating with the Stockfish Bot process
-    # The pipe can receive the following commands:
-    # - "START": Resets and starts the Stockfish Bot
-    # - "S_MOVE": Sends the Stockfish Bot a single move to make
-    #   Ex. "S_MOVEe4
-    # - "M_MOVE": Sends the Stockfish Bot multiple moves to make
-    #   Ex. "S_MOVEe4,c5,Nf3
-    # - "ERR_EXE": Notifies the GUI that the Stockfish Bot can't initialize Stockfish
-    # - "ERR_PERM": Notifies the GUI that the Stockfish Bot can't execute the Stockfish executable
-    # - "ERR_BOARD": Notifies the GUI that the Stockfish Bot can't find the board
-    # - "ERR_COLOR": Notifies the GUI that the Stockfish Bot can't find the player color
-    # - "ERR_MOVES": Notifies the GUI that the Stockfish Bot can't find the moves list
-    # - "ERR_GAMEOVER": Notifies the GUI that the current game is already over
-    def process_communicator_thread(self) -> None:
-        while not self.exit:
-            try:
-                if not (
-                    self.stockfish_bot_pipe is not None
-                    and self.stockfish_bot_pipe.poll()
-                ):
-                    continue
-                
-                # TODO: use match case
-                data = self.stockfish_bot_pipe.recv()
-                if data == "START":
-                    self.clear_tree()
-                    self.match_moves = []
-
-                    # Update the status text
-                    self.status_text["text"] = "Running"
-                    self.status_text["fg"] = "green"
-                    self.status_text.update()
-
-                    # Update the run button
-                    self.start_button["text"] = "Stop"
-                    self.start_button["state"] = "normal"
-                    self.start_button["command"] = self.on_stop_button_listener
-                    self.start_button.update()
-                elif data[:7] == "RESTART":
-                    self.restart_after_stopping = True
-                    self.stockfish_bot_pipe.send("DELETE")
-                elif data[:6] == "S_MOVE":
-                    move = data[6:]
-                    self.match_moves.append(move)
-                    self.insert_move(move)
-                    self.tree.yview_moveto(1)
-                elif data[:6] == "M_MOVE":
-                    moves = data[6:].split(",")
-                    self.match_moves += moves
-                    self.set_moves(moves)
-                    self.tree.yview_moveto(1)
-                elif data[:7] == "ERR_EXE":
-                    tk.messagebox.showerror(
-                        "Error", "Stockfish path provided is not valid!"
-                    )
-                elif data[:8] == "ERR_PERM":
-                    tk.messagebox.showerror(
-                        "Error", "Stockfish path provided is not executable!"
-                    )
-                elif data[:9] == "ERR_BOARD":
-                    tk.messagebox.showerror("Error", "Cant find board!")
-                elif data[:9] == "ERR_COLOR":
-                    tk.messagebox.showerror("Error", "Cant find player color!")
-                elif data[:9] == "ERR_MOVES":
-                    tk.messagebox.showerror("Error", "Cant find moves list!")
-                elif data[:12] == "ERR_GAMEOVER":
-                    tk.messagebox.showerror("Error", "Game has already finished!")
-            except OSError:
-                self.stockfish_bot_pipe = None
+        # Set Opening Browser button state to closed
+        self.open_browser_button["text"] = open_browser_text
+        self.open_browser_button["state"] = "normal"
 
-            time.sleep(0.1)
+        self.on_stop_button_listener()
+        self.chrome = None
 
-    def keypress_listener_thread(self) -> None:
-        while not self.exit:
-            time.sleep(0.1)
-            if not self.opened_browser:
-                continue
+    # Stops the bot when the Stockfish Bot process exits
+    def on_bot_process_exit(self, process) -> None:
+        if not self.running or process is not self.stockfish_bot_process:
+            return
+        self.logger.debug("stockfish bot process exited")
+        self.on_stop_button_listener()
 
-            if keyboard.is_pressed("1"):
-                self.on_start_button_listener()
-            elif keyboard.is_pressed("2"):
-                self.on_stop_button_listener()
+    def on_bot_messages(self, pipe, messages) -> None:
+        # Drop the messages of a bot that has been stopped since
+        if pipe is not self.stockfish_bot_pipe:
+            return
+        for message in messages:
+            self.on_bot_message(message)
+
+    # Handles a message from the Stockfish Bot process, on the Tk thread
+    # The messages are defined in protocol.py:
+    # - Status STARTED: Resets the GUI, the Stockfish Bot is running
+    # - Status WAITING: The game is over, the Stockfish Bot keeps running
+    #   and waits for the next game or puzzle
+    # - Moves: Moves to append to the move list, or to replace it with
+    #   Ex. Moves(["e4"]), Moves(["e4", "c5", "Nf3"], replace=True)
+    # - Error: Notifies the GUI that the Stockfish Bot can't start,
+    #   see protocol.ErrorCode
+    # - Eval: The latest evaluation of Stockfish
+    # - Timing: The time spent on the last move and the total latency
+    #   percentiles in milliseconds
+    # - Startup: The time from the start of the bot, or of a new game,
+    #   to its first move in milliseconds
+    def on_bot_message(self, message) -> None:
+        match message:
+            case Status(StatusCode.STARTED):
+                self.clear_tree()
+                self.match_moves = []
+                self.eval_text["text"] = ""
+                self.startup_text["text"] = ""
+                self.send_overlay(Overlay(OverlayCode.SHOW))
+
+                # Update the status text
+                self.status_text["text"] = "Running"
+                self.status_text["fg"] = "green"
+
+                # Update the run button
+                self.start_button["text"] = "Stop"
+                self.start_button["state"] = "normal"
+                self.start_button["command"] = self.on_stop_button_listener
+            case Status(StatusCode.WAITING):
+                self.status_text["text"] = "Waiting for the next game"
+                self.status_text["fg"] = "orange"
+            case Moves(moves, replace=False):
+                for move in moves:
+                    self.match_moves.append(move)
+                    self.insert_move(move)
+            case Moves(moves, replace=True):
+                self.match_moves = list(moves)
+                self.set_moves(moves)
+            case Error(code):
+                tk.messagebox.showerror("Error", error_messages[code])
+            case Eval(depth, (kind, value)):
+                score = f"#{value}" if kind == "mate" else f"{value / 100:+.2f}"
+                self.eval_text["text"] = f"Eval: {score} (depth {depth})"
+            case Timing(move, total):
+                self.latency_text["text"] = (
+                    f"Move latency: {move['total']:.0f} ms "
+                    f"(p95 {total['p95']:.0f} ms)"
+                )
+            case Startup(first_move, engine, page):
+                text = f"First move: {first_move:.0f} ms"
+                # The engine and page times are only measured when the bot starts
+                if not math.isnan(engine):
+                    text += f" (engine {engine:.0f} ms, page {page:.0f} ms)"
+                self.startup_text["text"] = text
+
+    def on_start_hotkey_listener(self) -> None:
+        if self.opened_browser and not self.running:
+            self.on_start_button_listener()
+
+    def on_stop_hotkey_listener(self) -> None:
+        if self.opened_browser and self.running:
+            self.on_stop_button_listener()
 
     def on_open_browser_button_listener(self) -> None:
         # Set Opening Browser button state to opening
@@ -468,6 +652,9 @@ class GUI:
         # Build Stockfish Bot
         self.chrome_url = self.chrome.service.service_url
         self.chrome_session_id = self.chrome.session_id
+        self.chrome_debugger_address = self.chrome.capabilities.get(
+            "goog:chromeOptions", {}
+        ).get("debuggerAddress")
 
         # Set Opening Browser button state to opened
         self.opening_browser = False
@@ -480,6 +667,9 @@ class GUI:
         self.start_button["state"] = "normal"
         self.start_button.update()
 
+        # Start checking whether the browser gets closed
+        self.wake_dispatcher()
+
     def on_start_button_listener(self) -> None:
         # Check if Slow mover value is valid
         slow_mover = self.slow_mover.get()
@@ -487,6 +677,16 @@ class GUI:
             tk.messagebox.showerror("Error", "Slow Mover must be between 10 and 1000")
             return
 
+        # Check if the move time value is valid (0 means no limit)
+        if self.move_time.get() < 0:
+            tk.messagebox.showerror("Error", "Max Move Time can't be negative")
+            return
+
+        # Check if the analysis cache memory value is valid
+        if self.cache_memory.get() < 1:
+            tk.messagebox.showerror("Error", "Cache must be at least 1 MB")
+            return
+
         # Check if stockfish path is not empty
         if self.stockfish_path == "":
             tk.messagebox.showerror("Error", "Stockfish path is empty")
@@ -504,17 +704,12 @@ class GUI:
         parent_conn, child_conn = multiprocess.Pipe()
         self.stockfish_bot_pipe = parent_conn
 
-        # Create the message queue that is used for the communication
-        # between the Stockfish and the Overlay processes
-        st_ov_queue = multiprocess.Queue()
-
         # Create the Stockfish Bot process
         self.stockfish_bot_process = StockfishBot(
             self.chrome_url,
             self.chrome_session_id,
             self.website.get(),
             child_conn,
-            st_ov_queue,
             self.stockfish_path,
             self.enable_manual_mode.get() == 1,
             self.enable_mouseless_mode.get() == 1,
@@ -525,14 +720,22 @@ class GUI:
             self.stockfish_depth.get(),
             self.memory.get(),
             self.cpu_threads.get(),
+            self.move_time.get(),
+            self.cache_memory.get(),
+            position_store_path if self.enable_position_store.get() == 1 else None,
+            self.book_path or None,
+            self.book_max_ply.get(),
+            self.enable_book_best_move.get() == 1,
+            self.syzygy_path or None,
+            self.chrome_debugger_address if self.enable_devtools.get() == 1 else None,
         )
         self.stockfish_bot_process.start()
 
-        # Create the overlay
-        self.overlay_screen_process = multiprocess.Process(
-            target=run, args=(st_ov_queue,)
-        )
-        self.overlay_screen_process.start()
+        # Start the overlay if it isn't running yet
+        self.start_overlay()
+
+        # Watch the new pipe and process
+        self.wake_dispatcher()
 
         # Update the run button
         self.running = True
@@ -548,18 +751,15 @@ class GUI:
 
         # Close the Stockfish Bot pipe
         if self.stockfish_bot_pipe is not None:
-            self.stockfish_bot_pipe.close()
-            self.stockfish_bot_pipe = None
+            with self.overlay_lock:
+                self.stockfish_bot_pipe.close()
+                self.stockfish_bot_pipe = None
 
-        # Stop the overlay
-        if self.overlay_screen_process is not None:
-            self.overlay_screen_process.kill()
-            self.overlay_screen_process = None
+        # Clear and hide the overlay, it is kept running for the next game
+        self.send_overlay(Overlay(OverlayCode.CLEAR), Overlay(OverlayCode.HIDE))
 
-        # Close the overlay pipe
-        if self.overlay_screen_pipe is not None:
-            self.overlay_screen_pipe.close()
-            self.overlay_screen_pipe = None
+        # Stop watching the closed pipe and process
+        self.wake_dispatcher()
 
         # Update the status text
         self.running = False
@@ -573,6 +773,46 @@ class GUI:
         self.start_button["command"] = self.on_start_button_listener
         self.start_button.update()
 
+    # Starts the overlay process, unless it is already running
+    def start_overlay(self) -> None:
+        if self.overlay_screen_process is not None and self.overlay_screen_process.is_alive():
+            return
+
+        # Create the pipe that is used for sending messages to the overlay
+        overlay_reader, overlay_writer = multiprocess.Pipe(duplex=False)
+        self.overlay_screen_process = multiprocess.Process(
+            target=run, args=(overlay_reader,)
+        )
+        self.overlay_screen_process.start()
+        with self.overlay_lock:
+            self.overlay_screen_channel = Channel(overlay_writer)
+
+    # Closes the overlay pipe, which makes the overlay process exit
+    def stop_overlay(self) -> None:
+        with self.overlay_lock:
+            if self.overlay_screen_channel is not None:
+                self.overlay_screen_channel.close()
+                self.overlay_screen_channel = None
+        if self.overlay_screen_process is not None:
+            self.overlay_screen_process.join(1)
+            if self.overlay_screen_process.is_alive():
+                self.overlay_screen_process.kill()
+            self.overlay_screen_process = None
+
+    # Sends messages to the overlay
+    # If pipe is given, the messages are dropped unless they come from the running bot
+    def send_overlay(self, *messages, pipe=None) -> None:
+        with self.overlay_lock:
+            if self.overlay_screen_channel is None:
+                return
+            if pipe is not None and pipe is not self.stockfish_bot_pipe:
+                return
+            try:
+                self.overlay_screen_channel.send(*messages)
+            except OSError:
+                # The overlay process is gone, it is started again with the next bot
+                self.overlay_screen_channel = None
+
     def on_topmost_check_button_listener(self) -> None:
         if self.enable_topmost.get() == 1:
             self.master.attributes("-topmost", True)
@@ -612,23 +852,48 @@ class GUI:
         self.stockfish_path_text["text"] = self.stockfish_path
         self.stockfish_path_text.update()
 
+    def on_select_book_button_listener(self) -> None:
+        # Create the file dialog
+        f = filedialog.askopenfilename(
+            filetypes=[("Polyglot Opening Book", "*.bin"), ("All Files", "*.*")]
+        )
+        if f is None:
+            return
+
+        # Set the opening book path
+        self.book_path = f
+        self.book_path_text["text"] = self.book_path
+        self.book_path_text.update()
+
+    def on_select_syzygy_button_listener(self) -> None:
+        # Create the directory dialog
+        d = filedialog.askdirectory()
+        if d is None:
+            return
+
+        # Set the Syzygy tablebases path
+        self.syzygy_path = d
+        self.syzygy_path_text["text"] = self.syzygy_path
+        self.syzygy_path_text.update()
+
     # Clears the Treeview
     def clear_tree(self) -> None:
         self.tree.delete(*self.tree.get_children())
-        self.tree.update()
+        self.tree_ply_count = 0
+        self.tree_last_row = None
 
     # Inserts a move into the Treeview
+    # White moves start a new row, black moves fill the last one
     def insert_move(self, move) -> None:
         self.logger.debug(f"inserting move: {move}")
-        cells_num = sum(
-            [len(self.tree.item(i)["values"]) - 1 for i in self.tree.get_children()]
-        )
-        if (cells_num % 2) == 0:
-            rows_num = len(self.tree.get_children())
-            self.tree.insert("", "end", text="1", values=(rows_num + 1, move))
+        if self.tree_ply_count % 2 == 0:
+            self.tree_last_row = self.tree.insert(
+                "", "end", text="1", values=(self.tree_ply_count // 2 + 1, move)
+            )
         else:
-            self.tree.set(self.tree.get_children()[-1], column=2, value=move)
-        self.tree.update()
+            self.tree.set(self.tree_last_row, column=2, value=move)
+        self.tree_ply_count += 1
+        self.scroll_tree_to_end()
 
     # Overwrites the Treeview with the given list of moves
     def set_moves(self, moves) -> None:
@@ -637,13 +902,30 @@ class GUI:
         # Insert in pairs
         pairs = list(zip(*[iter(moves)] * 2))
         for i, pair in enumerate(pairs):
-            self.tree.insert("", "end", text="1", values=(str(i + 1), pair[0], pair[1]))
+            self.tree_last_row = self.tree.insert(
+                "", "end", text="1", values=(str(i + 1), pair[0], pair[1])
+            )
 
         # Insert the remaining one if it exists
         if len(moves) % 2 == 1:
-            self.tree.insert("", "end", text="1", values=(len(pairs) + 1, moves[-1]))
+            self.tree_last_row = self.tree.insert(
+                "", "end", text="1", values=(len(pairs) + 1, moves[-1])
+            )
+
+        self.tree_ply_count = len(moves)
+        self.scroll_tree_to_end()
+
+    # Scrolls the Treeview to the last move once Tk is idle,
+    # so a burst of moves is drawn and scrolled only once
+    def scroll_tree_to_end(self) -> None:
+        if self.tree_scroll_scheduled:
+            return
+        self.tree_scroll_scheduled = True
+        self.master.after_idle(self.on_tree_scroll)
 
-        self.tree.update()
+    def on_tree_scroll(self) -> None:
+        self.tree_scroll_scheduled = False
+        self.tree.yview_moveto(1)
 
     def on_manual_mode_checkbox_listener(self) -> None:
         if self.enable_manual_mode.get() == 1:
@@ -0,0 +1,112 @@
+import csv
+import json
+import time
+
+# Stages of the game loop, in the order they happen for a move
+# - detect: from the opponent move appearing in the page to the bot reading it
+# - board: updating the board and Stockfish with the opponent move
+# - think: finding the move to play
+# - position: converting the move to screen coordinates
+# - input: moving the piece with the mouse or the mouseless move
+# - total: from the opponent move appearing in the page to our move being made
+STAGES = ("detect", "board", "think", "position", "input", "total")
+
+# Upper bounds of the histogram buckets in milliseconds
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, float("inf"))
+
+
+class LatencyRecorder:
+    """Records the time spent in every stage of the game loop, per move"""
+
+    def __init__(self) -> None:
+        # Samples in milliseconds, by stage
+        self.samples = {stage: [] for stage in STAGES}
+        self._move = {}
+        self._started = None
+        self._last = None
+
+    def start(self, offset=0.0) -> None:
+        """
+        Starts timing a move
+        Args:
+            offset: Seconds elapsed since the opponent move appeared in the page
+        """
+        now = time.monotonic()
+        self._started = now - offset
+        self._last = now
+        self._move = {}
+        if offset:
+            self._move["detect"] = offset * 1000
+
+    def mark(self, stage) -> None:
+        """Records the time elapsed since the previous mark as the given stage"""
+        if self._started is None:
+            return
+        now = time.monotonic()
+        self._move[stage] = self._move.get(stage, 0) + (now - self._last) * 1000
+        self._last = now
+
+    def finish(self) -> dict:
+        """Stops timing the move and returns its samples in milliseconds, by stage"""
+        if self._started is None:
+            return {}
+        self._move["total"] = (time.monotonic() - self._started) * 1000
+        for stage, sample in self._move.items():
+            self.samples[stage].append(sample)
+        self._started = None
+        return self._move
+
+    def percentiles(self, stage) -> dict:
+        """Returns the count, p50, p95, p99 and max of a stage in milliseconds"""
+        samples = sorted(self.samples[stage])
+        if not samples:
+            return {"count": 0}
+
+        def percentile(p) -> float:
+            return samples[min(len(samples) - 1, int(p / 100 * len(samples)))]
+
+        return {
+            "count": len(samples),
+            "p50": percentile(50),
+            "p95": percentile(95),
+            "p99": percentile(99),
+            "max": samples[-1],
+        }
+
+    def histogram(self, stage) -> list:
+        """Returns the number of samples of a stage in each bucket of BUCKETS"""
+        counts = [0] * len(BUCKETS)
+        for sample in self.samples[stage]:
+            for i, bound in enumerate(BUCKETS):
+                if sample <= bound:
+                    counts[i] += 1
+                    break
+        return counts
+
+    def summary(self) -> dict:
+        return {stage: self.percentiles(stage) for stage in STAGES}
+
+    def dump_json(self, path) -> None:
+        data = {
+            "buckets": [str(bound) for bound in BUCKETS],
+            "stages": {
+                stage: {
+                    **self.percentiles(stage),
+                    "histogram": self.histogram(stage),
+                }
+                for stage in STAGES
+            },
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+
+    def dump_csv(self, path) -> None:
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["stage", "count", "p50", "p95", "p99", "max"])
+            for stage in STAGES:
+                stats = self.percentiles(stage)
+                writer.writerow(
+                    [stage, stats["count"]]
+                    + [stats.get(key, "") for key in ("p50", "p95", "p99", "max")]
+                )
@@ -0,0 +1,47 @@
+import chess
+import chess.polyglot
+
+# Book readers opened in this process, by path
+# The readers memory-map the book file, so they are only opened once
+_readers = {}
+
+
+def open_book(path) -> chess.polyglot.MemoryMappedReader:
+    if path not in _readers:
+        _readers[path] = chess.polyglot.open_reader(path)
+    return _readers[path]
+
+
+class OpeningBook:
+    """Picks moves from a polyglot (.bin) opening book"""
+
+    def __init__(self, path, max_ply=16, best_move=False) -> None:
+        """
+        Args:
+            path: The path of the polyglot book
+            max_ply: The last ply the book is used for
+            best_move: Play the move with the highest weight
+                instead of a weighted random choice
+        """
+        self.path = path
+        self.max_ply = max_ply
+        self.best_move = best_move
+
+    def get_move(self, board: chess.Board, ply: int | None = None) -> str | None:
+        """
+        Returns a book move in UCI notation, None if the position is out of the book
+        ply is the number of plies played in the game, by default the one of the board
+        """
+        if ply is None:
+            ply = board.ply()
+        if ply >= self.max_ply:
+            return None
+        reader = open_book(self.path)
+        try:
+            if self.best_move:
+                entry = reader.find(board)
+            else:
+                entry = reader.weighted_choice(board)
+        except IndexError:
+            return None
+        return entry.move.uci()
@@ -2,18 +2,42 @@ import logging
 import math
 import sys
 import threading
-from typing import Any, NoReturn
+from collections import OrderedDict
 
-from PyQt5.QtCore import QPoint, Qt
-from PyQt5.QtGui import QBrush, QColor, QGuiApplication, QPainter, QPen, QPolygon
+from PyQt5.QtCore import QPoint, Qt, pyqtSignal
+from PyQt5.QtGui import (
+    QBrush,
+    QColor,
+    QGuiApplication,
+    QPainter,
+    QPen,
+    QPolygon,
+    QRegion,
+)
 from PyQt5.QtWidgets import QApplication, QWidget
 
+from .protocol import Arrows, Channel, Overlay, OverlayCode, ProtocolError
+
+# Maximum number of arrow polygons kept in the cache
+POLYGON_CACHE_SIZE = 4096
+
+# Opacity of the first arrow, decreasing by ARROW_ALPHA_STEP
+# for every next arrow down to ARROW_MIN_ALPHA
+ARROW_ALPHA = 122
+ARROW_ALPHA_STEP = 16
+ARROW_MIN_ALPHA = 40
+
 
 class OverlayScreen(QWidget):
-    def __init__(self, stockfish_queue) -> None:
+    # Emitted by the message thread when messages are waiting for the Qt thread
+    messages_received = pyqtSignal()
+    # Emitted by the message thread when the GUI closed the pipe
+    pipe_closed = pyqtSignal()
+
+    def __init__(self, gui_pipe) -> None:
         super().__init__()
         self.logger = logging.getLogger(f"CAB.{self.__class__.__name__}")
-        self.stockfish_queue = stockfish_queue
+        self.gui_channel = Channel(gui_pipe)
 
         # Set the window to be the size of the screen
         self.screen = QGuiApplication.screens()[0]
@@ -25,16 +49,35 @@ class OverlayScreen(QWidget):
         self.setWindowFlags(
             Qt.WindowType.FramelessWindowHint | Qt.WindowType.WindowStaysOnTopHint
         )
-        # A list of QPolygon objects containing the points of the arrows
+        # The ((start_x, start_y), (end_x, end_y)) screen coordinates of the arrows drawn,
+        # and their (QPolygon, bounding QRect) pairs
+        self.arrow_keys = []
         self.arrows = []
-        # Start the message queue thread
-        self.message_queue_thread = threading.Thread(target=self.message_queue_thread)
-        self.message_queue_thread.start()
+        # (QPolygon, bounding QRect) pairs by screen coordinates, least recently used first
+        # For a board geometry the coordinates stand for a pair of squares,
+        # so the arrows of a game are computed once
+        self.polygons = OrderedDict()
+
+        # Messages received by the message thread and not applied yet by the Qt thread.
+        # Only the newest arrows are kept, so stale arrows are never drawn
+        self._pending_lock = threading.Lock()
+        self._pending_arrows = None
+        self._pending_commands = []
+        self._signalled = False
+
+        # The signals are emitted from the message thread,
+        # so their slots are queued and run on the Qt thread
+        self.messages_received.connect(self.apply_messages)
+        self.pipe_closed.connect(QApplication.quit)
+
+        # Start the message thread
+        self.message_thread = threading.Thread(target=self.message_thread, daemon=True)
+        self.message_thread.start()
 
-    def message_queue_thread(self) -> NoReturn:
+    def message_thread(self) -> None:
         """
-        This thread is used to receive messages from the stockfish message queue
-        and update the arrows
+        This thread is used to receive messages from the GUI pipe
+        and hand them over to the Qt thread, until the pipe is closed
         Args:
             None
         Returns:
@@ -42,40 +85,123 @@ class OverlayScreen(QWidget):
         """
 
         while True:
-            message = self.stockfish_queue.get()
-            self.set_arrows(message)
+            try:
+                messages = self.gui_channel.recv()
+            except ProtocolError as e:
+                self.logger.warning(f"dropping message: {e}")
+                continue
+            except (EOFError, OSError):
+                self.pipe_closed.emit()
+                return
+
+            with self._pending_lock:
+                for message in messages:
+                    if isinstance(message, Arrows):
+                        self._pending_arrows = message.arrows
+                    elif isinstance(message, Overlay):
+                        if message.code == OverlayCode.CLEAR:
+                            self._pending_arrows = []
+                        self._pending_commands.append(message.code)
+                # Signal once until the Qt thread applies the messages
+                signal = not self._signalled
+                self._signalled = True
+            if signal:
+                self.messages_received.emit()
+
+    def apply_messages(self) -> None:
+        """
+        This function is used to apply the pending messages on the Qt thread
+        Args:
+            None
+        Returns:
+            None
+        """
+
+        with self._pending_lock:
+            arrows = self._pending_arrows
+            commands = self._pending_commands
+            self._pending_arrows = None
+            self._pending_commands = []
+            self._signalled = False
+
+        for code in commands:
+            if code == OverlayCode.SHOW:
+                self.show()
+            elif code == OverlayCode.HIDE:
+                self.hide()
+        if arrows is not None:
+            self.set_arrows(arrows)
 
     def set_arrows(self, arrows) -> None:
         """
         This function is used to set the arrows to be drawn on the screen
+        Only the areas of the previous and the new arrows are repainted
         Args:
             arrows: A list of tuples containing the start and end position of the arrows
-            in the form of ((start_point, end_point), (start_point, end_point))
+            in the form of ((start_point, end_point), (start_point, end_point)),
+            the first arrow is drawn the most opaque
         Returns:
             None
         """
 
-        self.arrows = []
-        for arrow in arrows:
-            poly = self.get_arrow_polygon(
-                QPoint(arrow[0][0], arrow[0][1]), QPoint(arrow[1][0], arrow[1][1])
-            )
-            self.arrows.append(poly)
-        self.update()
-
-    def paint_event(self, event) -> None:
-        self.logger.debug("paint event")
+        keys = [
+            ((int(start[0]), int(start[1])), (int(end[0]), int(end[1])))
+            for start, end in arrows
+        ]
+        # An arrow needs a direction
+        keys = [key for key in keys if key[0] != key[1]]
+        if keys == self.arrow_keys:
+            return
+
+        damaged = QRegion()
+        for _, rect in self.arrows:
+            damaged = damaged.united(rect)
+        self.arrow_keys = keys
+        self.arrows = [self.get_cached_polygon(key) for key in keys]
+        for _, rect in self.arrows:
+            damaged = damaged.united(rect)
+        if not damaged.isEmpty():
+            self.update(damaged)
+
+    def get_cached_polygon(self, key) -> tuple:
+        """
+        This function is used to get the polygon of an arrow from the cache,
+        computing it if it is not cached
+        Args:
+            key: The ((start_x, start_y), (end_x, end_y)) screen coordinates of the arrow
+        Returns:
+            A tuple of the QPolygon of the arrow and its bounding QRect
+        """
+
+        entry = self.polygons.get(key)
+        if entry is not None:
+            self.polygons.move_to_end(key)
+            return entry
+
+        polygon = self.get_arrow_polygon(QPoint(*key[0]), QPoint(*key[1]))
+        # Pad the bounding rectangle to cover the antialiased edges
+        entry = (polygon, polygon.boundingRect().adjusted(-2, -2, 2, 2))
+        self.polygons[key] = entry
+        if len(self.polygons) > POLYGON_CACHE_SIZE:
+            self.polygons.popitem(last=False)
+        return entry
+
+    def paintEvent(self, event) -> None:  # NOSONAR Qt override
         super().paintEvent(event)
         painter = QPainter(self)
         painter.setPen(QPen(Qt.GlobalColor.red, 1, Qt.PenStyle.NoPen))
-        painter.setBrush(QBrush(QColor(255, 0, 0, 122), Qt.BrushStyle.SolidPattern))
-        for arrow in self.arrows:
-            painter.drawPolygon(arrow)
+        region = event.region()
+        # Draw the first arrow last, on top of the others
+        for i, (polygon, rect) in reversed(list(enumerate(self.arrows))):
+            if not region.intersects(rect):
+                continue
+            alpha = max(ARROW_MIN_ALPHA, ARROW_ALPHA - ARROW_ALPHA_STEP * i)
+            painter.setBrush(QBrush(QColor(255, 0, 0, alpha), Qt.BrushStyle.SolidPattern))
+            painter.drawPolygon(polygon)
         painter.end()
 
-    # TODO: Catch and handle specific errors
     @staticmethod
-    def get_arrow_polygon(start_point, end_point) -> Any:
+    def get_arrow_polygon(start_point, end_point) -> QPolygon:
         """
         This function is used to get the polygon for the arrow
         Args:
@@ -131,16 +257,16 @@ class OverlayScreen(QWidget):
             ]
         )
 
-def run(stockfish_queue) -> None:
+def run(gui_pipe) -> None:
     """
     This function is used to run the overlay
     Args:
-        stockfish_queue: The message queue used to communicate with the stockfish thread
+        gui_pipe: The pipe used to receive the messages of the GUI
     Returns:
         None
     """
 
     app = QApplication(sys.argv)
-    overlay = OverlayScreen(stockfish_queue)
-    overlay.show()
+    # The overlay is shown when the GUI sends the show command
+    overlay = OverlayScreen(gui_pipe)  # NOSONAR the reference keeps the window alive
     app.exec()
\ No newline at end of file
@@ -0,0 +1,143 @@
+import logging
+import sqlite3
+import time
+
+import chess
+import chess.polyglot
+
+from .analysis_cache import CacheEntry
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS positions (
+    hash INTEGER NOT NULL,
+    skill_level INTEGER NOT NULL,
+    multipv INTEGER NOT NULL,
+    best_move TEXT NOT NULL,
+    ponder_move TEXT,
+    score_type TEXT,
+    score INTEGER,
+    depth INTEGER NOT NULL,
+    pv TEXT NOT NULL,
+    last_used INTEGER NOT NULL,
+    PRIMARY KEY (hash, skill_level, multipv)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS positions_last_used ON positions (last_used);
+"""
+
+# Keeps the deeper result when a position is stored twice
+_UPSERT = """
+INSERT INTO positions (
+    hash, skill_level, multipv, best_move, ponder_move,
+    score_type, score, depth, pv, last_used
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (hash, skill_level, multipv) DO UPDATE SET
+    best_move = excluded.best_move,
+    ponder_move = excluded.ponder_move,
+    score_type = excluded.score_type,
+    score = excluded.score,
+    depth = excluded.depth,
+    pv = excluded.pv,
+    last_used = excluded.last_used
+WHERE excluded.depth >= positions.depth
+"""
+
+
+class PositionStore:
+    """
+    Persistent store of search results shared across sessions and processes.
+    Backed by an SQLite database in WAL mode, so several bots can read it
+    while one of them writes. The least recently used positions are removed
+    when the store grows past its size cap
+    """
+
+    # Number of writes between two size checks
+    COMPACT_INTERVAL = 1000
+
+    def __init__(self, path, max_entries=1_000_000) -> None:
+        self.logger = logging.getLogger(f"CAB.{self.__class__.__name__}")
+        self.max_entries = max_entries
+        self._writes = 0
+
+        # Autocommit, every statement is its own transaction
+        self.connection = sqlite3.connect(path, timeout=5.0, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(_SCHEMA)
+
+    @staticmethod
+    def key(board: chess.Board) -> int:
+        # SQLite integers are signed 64 bits
+        zobrist = chess.polyglot.zobrist_hash(board)
+        return zobrist - (1 << 64) if zobrist >= 1 << 63 else zobrist
+
+    def get(self, board: chess.Board, depth, skill_level, multipv=1) -> CacheEntry | None:
+        """Returns the entry of the position if it was searched at least as deep as depth"""
+        key = self.key(board)
+        row = self.connection.execute(
+            "SELECT best_move, ponder_move, score_type, score, depth, pv FROM positions "
+            "WHERE hash = ? AND skill_level = ? AND multipv = ? AND depth >= ?",
+            (key, skill_level, multipv, depth),
+        ).fetchone()
+        if row is None:
+            return None
+
+        self._execute(
+            "UPDATE positions SET last_used = ? WHERE hash = ? AND skill_level = ? AND multipv = ?",
+            (int(time.time()), key, skill_level, multipv),
+        )
+        best_move, ponder_move, score_type, score, depth, pv = row
+        return CacheEntry(
+            best_move,
+            ponder_move,
+            None if score_type is None else (score_type, score),
+            depth,
+            pv.split(),
+        )
+
+    def put(self, board: chess.Board, entry: CacheEntry, skill_level, multipv=1) -> None:
+        """Stores the entry unless a deeper one is already stored"""
+        score_type, score = entry.score if entry.score is not None else (None, None)
+        self._execute(
+            _UPSERT,
+            (
+                self.key(board),
+                skill_level,
+                multipv,
+                entry.best_move,
+                entry.ponder_move,
+                score_type,
+                score,
+                entry.depth,
+                " ".join(entry.pv),
+                int(time.time()),
+            ),
+        )
+        self._writes += 1
+        if self._writes % self.COMPACT_INTERVAL == 0:
+            self.compact()
+
+    def compact(self) -> None:
+        """Removes the least recently used positions down to 90% of the size cap"""
+        count = self.connection.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        keep = int(self.max_entries * 0.9)
+        self.logger.debug(f"compacting position store from {count} to {keep} entries")
+        self._execute(
+            "DELETE FROM positions WHERE (hash, skill_level, multipv) IN ("
+            "SELECT hash, skill_level, multipv FROM positions "
+            "ORDER BY last_used ASC LIMIT ?)",
+            (count - keep,),
+        )
+        self._execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def _execute(self, sql, parameters=()) -> None:
+        # Another process holding the write lock longer than the timeout
+        # only costs us this write
+        try:
+            self.connection.execute(sql, parameters)
+        except sqlite3.OperationalError as e:
+            self.logger.warning(f"position store write failed: {e}")
+
+    def close(self) -> None:
+        self.connection.close()
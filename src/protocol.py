@@ -0,0 +1,356 @@
+"""
+Messages exchanged between the GUI, the Stockfish Bot and the overlay processes.
+Messages are encoded with struct into frames holding a batch of messages,
+so bursts of messages cost a single send over the pipe.
+
+Frame layout (little endian):
+    version: B, message count: H
+    then for every message: type: B, payload length: H, payload
+"""
+import math
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+from enum import IntEnum
+
+from .latency import STAGES
+
+PROTOCOL_VERSION = 2
+
+# Seconds between two sends of the coalesced messages (eval updates)
+COALESCE_INTERVAL = 0.1
+
+_FRAME_HEADER = struct.Struct("<BH")
+_MESSAGE_HEADER = struct.Struct("<BH")
+
+
+class ProtocolError(ValueError):
+    """Raised when a frame can't be decoded"""
+
+
+class MessageType(IntEnum):
+    STATUS = 1
+    MOVES = 2
+    ERROR = 3
+    EVAL = 4
+    ARROWS = 5
+    TIMING = 6
+    OVERLAY = 7
+    STARTUP = 8
+
+
+class StatusCode(IntEnum):
+    # The bot found the game and started playing (bot -> GUI)
+    STARTED = 1
+    # The game is over, the bot waits for the next game or puzzle (bot -> GUI)
+    WAITING = 2
+
+
+class ErrorCode(IntEnum):
+    # Stockfish can't be started
+    ENGINE_NOT_FOUND = 1
+    # The Stockfish executable can't be executed
+    ENGINE_NOT_EXECUTABLE = 2
+    # The board is not found
+    BOARD_NOT_FOUND = 3
+    # The player color is not found
+    COLOR_NOT_FOUND = 4
+    # The moves list is not found
+    MOVES_NOT_FOUND = 5
+    # The game is already over
+    GAME_OVER = 6
+
+
+class OverlayCode(IntEnum):
+    # Shows the overlay window
+    SHOW = 1
+    # Hides the overlay window
+    HIDE = 2
+    # Removes the arrows, including the ones not drawn yet
+    CLEAR = 3
+
+
+@dataclass
+class Status:
+    code: StatusCode
+
+
+@dataclass
+class Moves:
+    """Moves in SAN, appended to the move list or replacing it"""
+    moves: list
+    replace: bool = False
+
+
+@dataclass
+class Error:
+    code: ErrorCode
+
+
+@dataclass
+class Eval:
+    """An engine evaluation update, from the bot's point of view"""
+    depth: int
+    # ("cp", centipawns) or ("mate", moves)
+    score: tuple
+    nodes: int = 0
+    nps: int = 0
+    # The principal variation in UCI moves
+    pv: list = field(default_factory=list)
+
+
+@dataclass
+class Arrows:
+    """Arrows drawn by the overlay, an empty list clears them"""
+    # ((start_x, start_y), (end_x, end_y)) screen coordinates of every arrow
+    arrows: list
+
+
+@dataclass
+class Timing:
+    """Latency of the last move"""
+    # Milliseconds spent in every stage of the move, by stage name
+    move: dict
+    # Count, p50, p95, p99 and max of the total latency of all moves in milliseconds
+    total: dict
+
+
+@dataclass
+class Startup:
+    """Time from the start of the bot, or of a new game, to the first bot move"""
+    # Milliseconds until the first move was made
+    first_move: float
+    # Milliseconds spent starting the engine and attaching to the page and reading it,
+    # NaN for the games after the first one
+    engine: float = math.nan
+    page: float = math.nan
+
+
+@dataclass
+class Overlay:
+    """A command to the overlay (GUI -> overlay)"""
+    code: OverlayCode
+
+
+def _pack_strings(strings) -> bytes:
+    data = bytearray(struct.pack("<H", len(strings)))
+    for string in strings:
+        encoded = string.encode("utf-8")[:255]
+        data += struct.pack("<B", len(encoded)) + encoded
+    return bytes(data)
+
+
+def _unpack_strings(payload, offset) -> tuple[list, int]:
+    (count,) = struct.unpack_from("<H", payload, offset)
+    offset += 2
+    strings = []
+    for _ in range(count):
+        length = payload[offset]
+        strings.append(payload[offset + 1:offset + 1 + length].decode("utf-8"))
+        offset += 1 + length
+    return strings, offset
+
+
+def _encode_status(message: Status) -> bytes:
+    return struct.pack("<B", message.code)
+
+
+def _decode_status(payload) -> Status:
+    return Status(StatusCode(payload[0]))
+
+
+def _encode_moves(message: Moves) -> bytes:
+    return struct.pack("<B", message.replace) + _pack_strings(message.moves)
+
+
+def _decode_moves(payload) -> Moves:
+    moves, _ = _unpack_strings(payload, 1)
+    return Moves(moves, bool(payload[0]))
+
+
+def _encode_error(message: Error) -> bytes:
+    return struct.pack("<B", message.code)
+
+
+def _decode_error(payload) -> Error:
+    return Error(ErrorCode(payload[0]))
+
+
+_EVAL = struct.Struct("<HBiQI")
+
+
+def _encode_eval(message: Eval) -> bytes:
+    kind, value = message.score
+    return _EVAL.pack(
+        message.depth, kind == "mate", value, message.nodes, message.nps
+    ) + _pack_strings(message.pv)
+
+
+def _decode_eval(payload) -> Eval:
+    depth, mate, value, nodes, nps = _EVAL.unpack_from(payload)
+    pv, _ = _unpack_strings(payload, _EVAL.size)
+    return Eval(depth, ("mate" if mate else "cp", value), nodes, nps, pv)
+
+
+_ARROW = struct.Struct("<iiii")
+
+
+def _encode_arrows(message: Arrows) -> bytes:
+    data = bytearray(struct.pack("<B", len(message.arrows)))
+    for (start_x, start_y), (end_x, end_y) in message.arrows:
+        data += _ARROW.pack(int(start_x), int(start_y), int(end_x), int(end_y))
+    return bytes(data)
+
+
+def _decode_arrows(payload) -> Arrows:
+    arrows = []
+    for i in range(payload[0]):
+        start_x, start_y, end_x, end_y = _ARROW.unpack_from(payload, 1 + i * _ARROW.size)
+        arrows.append(((start_x, start_y), (end_x, end_y)))
+    return Arrows(arrows)
+
+
+# Stage samples (NaN when missing), then the count, p50, p95, p99 and max of the total
+_TIMING = struct.Struct(f"<{len(STAGES)}fI4f")
+_TOTAL_KEYS = ("p50", "p95", "p99", "max")
+
+
+def _encode_timing(message: Timing) -> bytes:
+    return _TIMING.pack(
+        *(message.move.get(stage, math.nan) for stage in STAGES),
+        message.total.get("count", 0),
+        *(message.total.get(key, math.nan) for key in _TOTAL_KEYS),
+    )
+
+
+def _decode_timing(payload) -> Timing:
+    values = _TIMING.unpack(payload)
+    move = {
+        stage: sample for stage, sample in zip(STAGES, values) if not math.isnan(sample)
+    }
+    count = values[len(STAGES)]
+    total = {"count": count}
+    if count:
+        total.update(zip(_TOTAL_KEYS, values[len(STAGES) + 1:]))
+    return Timing(move, total)
+
+
+_STARTUP = struct.Struct("<3f")
+
+
+def _encode_startup(message: Startup) -> bytes:
+    return _STARTUP.pack(message.first_move, message.engine, message.page)
+
+
+def _decode_startup(payload) -> Startup:
+    return Startup(*_STARTUP.unpack(payload))
+
+
+def _encode_overlay(message: Overlay) -> bytes:
+    return struct.pack("<B", message.code)
+
+
+def _decode_overlay(payload) -> Overlay:
+    return Overlay(OverlayCode(payload[0]))
+
+
+# message class: (type, encoder, decoder)
+_CODECS = {
+    Status: (MessageType.STATUS, _encode_status, _decode_status),
+    Moves: (MessageType.MOVES, _encode_moves, _decode_moves),
+    Error: (MessageType.ERROR, _encode_error, _decode_error),
+    Eval: (MessageType.EVAL, _encode_eval, _decode_eval),
+    Arrows: (MessageType.ARROWS, _encode_arrows, _decode_arrows),
+    Timing: (MessageType.TIMING, _encode_timing, _decode_timing),
+    Overlay: (MessageType.OVERLAY, _encode_overlay, _decode_overlay),
+    Startup: (MessageType.STARTUP, _encode_startup, _decode_startup),
+}
+_DECODERS = {message_type: decode for message_type, _, decode in _CODECS.values()}
+
+
+def encode(messages) -> bytes:
+    """Encodes a batch of messages into a frame"""
+    data = bytearray(_FRAME_HEADER.pack(PROTOCOL_VERSION, len(messages)))
+    for message in messages:
+        message_type, encoder, _ = _CODECS[type(message)]
+        payload = encoder(message)
+        data += _MESSAGE_HEADER.pack(message_type, len(payload)) + payload
+    return bytes(data)
+
+
+def decode(data) -> list:
+    """
+    Decodes a frame into its batch of messages
+    Raises:
+        ProtocolError: If the frame has another version or is malformed
+    """
+    try:
+        version, count = _FRAME_HEADER.unpack_from(data)
+        if version != PROTOCOL_VERSION:
+            raise ProtocolError(f"unsupported protocol version {version}")
+        offset = _FRAME_HEADER.size
+        messages = []
+        for _ in range(count):
+            message_type, length = _MESSAGE_HEADER.unpack_from(data, offset)
+            offset += _MESSAGE_HEADER.size
+            payload = data[offset:offset + length]
+            offset += length
+            messages.append(_DECODERS[MessageType(message_type)](payload))
+        return messages
+    except ProtocolError:
+        raise
+    except (struct.error, IndexError, KeyError, ValueError) as e:
+        raise ProtocolError(f"malformed frame: {e}") from e
+
+
+class Channel:
+    """
+    Sends and receives batches of messages over a multiprocess Connection.
+    Eval updates are coalesced: only the latest one is kept, and they are
+    sent at most every COALESCE_INTERVAL seconds or along with the next batch,
+    so a fast analysis stream can't fill up the pipe.
+    It can be used from several threads
+    """
+
+    def __init__(self, connection) -> None:
+        self.connection = connection
+        self._lock = threading.Lock()
+        self._pending_eval = None
+        self._last_eval_sent = 0.0
+
+    def send(self, *messages) -> None:
+        """Sends the messages, and the pending eval update, in a single frame"""
+        with self._lock:
+            self._send(list(messages))
+
+    def send_eval(self, message: Eval) -> None:
+        """Sends the eval update, or keeps it for later if one was sent just before"""
+        with self._lock:
+            self._pending_eval = message
+            if time.monotonic() - self._last_eval_sent >= COALESCE_INTERVAL:
+                self._send([])
+
+    def flush(self) -> None:
+        """Sends the pending eval update, if any"""
+        with self._lock:
+            if self._pending_eval is not None:
+                self._send([])
+
+    def _send(self, messages) -> None:
+        if self._pending_eval is not None:
+            messages.append(self._pending_eval)
+            self._pending_eval = None
+            self._last_eval_sent = time.monotonic()
+        if messages:
+            self.connection.send_bytes(encode(messages))
+
+    def poll(self, timeout=0.0) -> bool:
+        return self.connection.poll(timeout)
+
+    def recv(self) -> list:
+        """Blocks until a frame is received and returns its messages"""
+        return decode(self.connection.recv_bytes())
+
+    def close(self) -> None:
+        self.connection.close()
@@ -1,26 +1,71 @@
 import logging
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import chess
 import keyboard
 import multiprocess
-import pyautogui
-from stockfish import Stockfish
-
+from selenium.common import (
+    InvalidSessionIdException,
+    NoSuchWindowException,
+    WebDriverException,
+)
+
+try:
+    import pyautogui
+except Exception:  # NOSONAR
+    # pyautogui needs a display, which headless benchmarks don't have
+    pyautogui = None
+
+from .analysis_cache import AnalysisCache, CacheEntry
+from .board_sync import BoardSync, SyncResult
 from .grabbers.chesscom_grabber import ChesscomGrabber
+from .grabbers.grabber import Grabber, PageSnapshot
 from .grabbers.lichess_grabber import LichessGrabber
-from .utilities import char_to_num
+from .latency import LatencyRecorder
+from .opening_book import OpeningBook
+from .position_store import PositionStore
+from .protocol import (
+    Arrows,
+    Channel,
+    Error,
+    ErrorCode,
+    Eval,
+    Moves,
+    Startup,
+    Status,
+    StatusCode,
+    Timing,
+)
+from .tablebase import TablebaseProber
+from .uci_engine import UciEngine
+
+
+# Files the move latency statistics are written to at the end of a game
+LATENCY_JSON_PATH = "latency.json"
+LATENCY_CSV_PATH = "latency.csv"
+
+# Milliseconds Stockfish keeps in reserve on every move
+# for reading the page and moving the piece
+MOVE_OVERHEAD = 300
+
+# Seconds between two reads of the page while the game over window
+# of a finished game is open and the bot waits for the next game
+NEW_GAME_POLL_INTERVAL = 0.5
 
 
 class StockfishBot(multiprocess.Process):
+    # Moves the mouse to make moves, anything with the pyautogui
+    # moveTo, dragTo and click functions
+    mouse = pyautogui
+
     def __init__(
         self,
         chrome_url,
         chrome_session_id,
         website,
-        pipe, # multiprocess.Pipe
-        overlay_queue, # multiprocess.Queue
+        pipe, # multiprocess.Pipe connection to the GUI
         stockfish_path,
         enable_manual_mode,
         enable_mouseless_mode,
@@ -31,15 +76,26 @@ class StockfishBot(multiprocess.Process):
         stockfish_depth,
         memory,
         cpu_threads,
+        move_time=0,
+        cache_memory=16,
+        position_store_path=None,
+        book_path=None,
+        book_max_ply=16,
+        book_best_move=False,
+        syzygy_path=None,
+        chrome_debugger_address=None,
     ) -> None:
         multiprocess.Process.__init__(self)
         self.logger = logging.getLogger(f"CAB.{self.__class__.__name__}")
 
         self.chrome_url = chrome_url
         self.chrome_session_id = chrome_session_id
+        # The scripts of the grabber run over DevTools if the address is given
+        self.chrome_debugger_address = chrome_debugger_address
         self.website = website
         self.pipe = pipe
-        self.overlay_queue = overlay_queue
+        # Protocol channel over the pipe, created in the bot process
+        self.channel = None
         self.stockfish_path = stockfish_path
         self.enable_manual_mode = enable_manual_mode
         self.enable_mouseless_mode = enable_mouseless_mode
@@ -51,48 +107,54 @@ class StockfishBot(multiprocess.Process):
         self.grabber = None
         self.memory = memory
         self.cpu_threads = cpu_threads
+        # Wall-clock budget per move in milliseconds, 0 for no limit
+        self.move_time = move_time
+        # Search results of the positions already analysed
+        self.analysis_cache = AnalysisCache(cache_memory)
+        # Search results persisted across sessions, opened in the bot process
+        self.position_store_path = position_store_path
+        self.position_store = None
+        # Polyglot opening book tried before searching
+        self.opening_book = (
+            None
+            if book_path is None
+            else OpeningBook(book_path, book_max_ply, book_best_move)
+        )
+        # Syzygy tablebases probed before searching, opened in the bot process
+        self.syzygy_path = syzygy_path
+        self.tablebase = None
+        # Keeps the board and Stockfish in step with the page, created in the bot process
+        self.board_sync = None
+        # Time spent in every stage of the game loop, for the current game
+        self.latency = LatencyRecorder()
+        # Wall-clock time the bot was created, in the GUI process when Start is pressed
+        self.created_at = time.time()
+        # Wall-clock time the current game started, until its first move is made
+        self._game_started_at = None
+        # Milliseconds spent starting the engine and reading the page, for the first game
+        self._bootstrap = {}
         self.is_white = None
 
     # Converts a move to screen coordinates
     # Example: "a1" -> (x, y)
     def move_to_screen_position(self, move) -> tuple:
         self.logger.debug(f"converting move to screen position: {move}")
-        # Get the absolute top left corner of the website
-        canvas_x_offset, canvas_y_offset = self.grabber.get_top_left_corner()
-
-        # Get the absolute board position
-        board_x = canvas_x_offset + self.grabber.get_board().location["x"]
-        board_y = canvas_y_offset + self.grabber.get_board().location["y"]
-
-        # Get the square size
-        square_size = self.grabber.get_board().size["width"] / 8
-
-        # Depending on the player color, the board is flipped, so the coordinates need to be adjusted
-        if self.is_white:
-            x = board_x + square_size * (char_to_num(move[0]) - 1) + square_size / 2
-            y = board_y + square_size * (8 - int(move[1])) + square_size / 2
-        else:
-            x = board_x + square_size * (8 - char_to_num(move[0])) + square_size / 2
-            y = board_y + square_size * (int(move[1]) - 1) + square_size / 2
-
-        return x, y
+        return self.grabber.get_geometry().square_position(move)
 
     def get_move_position(self, move) -> tuple[tuple, tuple]:
         self.logger.debug(f"getting move position: {move}")
         # Get the start and end position screen coordinates
-        start_pos_x, start_pos_y = self.move_to_screen_position(move[:2])
-        end_pos_x, end_pos_y = self.move_to_screen_position(move[2:4])
-
-        return (start_pos_x, start_pos_y), (end_pos_x, end_pos_y)
+        return self.grabber.get_geometry().move_position(move)
 
     def make_move(self, move) -> None:
         self.logger.debug(f"making move {move}")
         # Get the start and end position screen coordinates
         start_pos, end_pos = self.get_move_position(move)
+        self.latency.mark("position")
 
         # Drag the piece from the start to the end position
-        pyautogui.moveTo(start_pos[0], start_pos[1])
-        pyautogui.dragTo(end_pos[0], end_pos[1])
+        self.mouse.moveTo(start_pos[0], start_pos[1])
+        self.mouse.dragTo(end_pos[0], end_pos[1])
 
         # Check for promotion. If there is a promotion,
         # promote to the corresponding piece type
@@ -117,14 +179,24 @@ class StockfishBot(multiprocess.Process):
                 move[2] + str(int(move[3]) - 3)
             )
 
-        pyautogui.moveTo(x=end_pos_x, y=end_pos_y)
-        pyautogui.click(button="left")
+        self.mouse.moveTo(x=end_pos_x, y=end_pos_y)
+        self.mouse.click(button="left")
 
-    def wait_for_gui_to_delete(self) -> None:
-        while self.pipe.recv() != "DELETE":
-            pass # NOSONAR
+    def _on_engine_info(self, info) -> None:
+        """Stream the evaluation to the GUI, called from the engine reader thread"""
+        if "score" not in info:
+            return
+        self.channel.send_eval(
+            Eval(
+                depth=info["depth"],
+                score=info["score"],
+                nodes=info.get("nodes", 0),
+                nps=info.get("nps", 0),
+                pv=info.get("pv", []),
+            )
+        )
 
-    def _init_stockfish(self) -> None:
+    def _init_stockfish(self) -> UciEngine | None:
         """Initialize Stockfish"""
         self.logger.debug("initializing stockfish")
         parameters = {
@@ -133,113 +205,262 @@ class StockfishBot(multiprocess.Process):
             "Ponder": "true",
             "Slow Mover": self.slow_mover,
             "Skill Level": self.skill_level,
+            "Move Overhead": MOVE_OVERHEAD,
         }
+        if self.syzygy_path is not None:
+            parameters["SyzygyPath"] = self.syzygy_path
         try:
-            return Stockfish(
-                path=self.stockfish_path,
+            return UciEngine(
+                self.stockfish_path,
                 depth=self.stockfish_depth,
                 parameters=parameters,
+                info_callback=self._on_engine_info,
             )
         except PermissionError:
-            self.pipe.send("ERR_PERM")
+            self.channel.send(Error(ErrorCode.ENGINE_NOT_EXECUTABLE))
             return
         except OSError:
-            self.pipe.send("ERR_EXE")
+            self.channel.send(Error(ErrorCode.ENGINE_NOT_FOUND))
             return
 
-    def _check_board(self) -> bool:
-        """Return if the board element is not found"""
-        self.logger.debug("checking board")
-        self.grabber.update_board_element()
-        return self.grabber.get_board() is not None
-
-    def _check_starting_position(self) -> list | None:
-        """
-        Get the starting position
-        Return if the starting position is not found
-        """
-        self.logger.debug("checking starting position")
-        move_list = self.grabber.get_move_list()
-        if move_list is None:
-            self.pipe.send("ERR_MOVES")
-            return None
-        return move_list
-
-    def _check_is_white(self) -> bool:
-        self.logger.debug("checking is white")
-        self.is_white = self.grabber.is_white()
-        return self.is_white is not None
-
     def _check_game_over(self, move_list: list) -> bool:
         """Check if the game is over"""
         self.logger.debug("checking game over")
         score_pattern = r"(\d+)\-(\d+)"
         if move_list and re.match(score_pattern, move_list[-1]):
-            self.pipe.send("ERR_GAMEOVER")
             return False
         return True
 
-    def _move_board(self, board: chess.Board, move_list: list) -> list:
-        """Update the board with the starting position"""
+    def _check_snapshot(self, snapshot: PageSnapshot) -> ErrorCode | None:
+        """Check that a game can be played in the page, return the error if not"""
+        if snapshot.board_rect is None:
+            return ErrorCode.BOARD_NOT_FOUND
+        if snapshot.is_white is None:
+            return ErrorCode.COLOR_NOT_FOUND
+        if snapshot.move_list is None:
+            return ErrorCode.MOVES_NOT_FOUND
+        if not self._check_game_over(snapshot.move_list):
+            return ErrorCode.GAME_OVER
+        return None
+
+    def _end_game(self) -> None:
+        """Report the statistics of the game that ended"""
+        # Deliver the last eval update of the game, held back by the coalescing
+        self.channel.flush()
+        self.logger.info(f"analysis cache: {self.analysis_cache.stats()}")
+        self.logger.info(f"move latency: {self.latency.summary()}")
+        try:
+            self.latency.dump_json(LATENCY_JSON_PATH)
+            self.latency.dump_csv(LATENCY_CSV_PATH)
+        except OSError as e:
+            self.logger.warning(f"can't write the latency statistics: {e}")
+
+    def _start_game(self, snapshot: PageSnapshot) -> chess.Board | None:
+        """
+        Set up the board and Stockfish with the game in the page and notify the GUI
+        Returns None if the move list of the page can't be played
+        """
+        self.is_white = snapshot.is_white
+        # The statistics reported at the end of the game are the ones of this game only
+        self.latency = LatencyRecorder()
         self.logger.debug("updating board with starting position")
-        for move in move_list:
-            board.push_san(move)
-        return [move.uci() for move in board.move_stack]
+        if not self.board_sync.reset(snapshot.move_list):
+            self.channel.send(Error(ErrorCode.MOVES_NOT_FOUND))
+            return None
+
+        # Notify GUI that bot is ready and send it the first moves
+        # (if there are any) in the same batch
+        messages = [Status(StatusCode.STARTED)]
+        if len(snapshot.move_list) > 0:
+            messages.append(Moves(snapshot.move_list, replace=True))
+        self.channel.send(*messages)
+        return self.board_sync.board
+
+    def _read_page(self, wait: float | None = None) -> PageSnapshot:
+        """
+        Read the page snapshot, first waiting for up to wait seconds for the move list to change.
+        A navigation, Ex. to a new game or puzzle, fails the script running in the page,
+        the whole page is then read again
+        """
+        while True:
+            try:
+                return self.grabber.snapshot(wait=wait)
+            except (NoSuchWindowException, InvalidSessionIdException):
+                # The browser is gone
+                raise
+            except WebDriverException as e:
+                self.logger.debug(f"the page changed while reading it: {e.msg}")
+                self.grabber.reset()
+                # Let the new page load
+                time.sleep(NEW_GAME_POLL_INTERVAL)
+
+    def _wait_for_next_game(self) -> PageSnapshot | None:
+        """
+        Wait until the page shows a new game or puzzle and return its snapshot,
+        moving on to the next puzzle first in non-stop puzzles mode.
+        It waits as long as it takes, subclasses can return None to stop the bot
+        """
+        self.logger.debug("waiting for the next game")
+        self.channel.send(Status(StatusCode.WAITING))
+        is_puzzles = self.grabber.last_snapshot.is_puzzles
+
+        # The moves of the finished game as the page shows them,
+        # or as the board has them if the page is already navigating away
+        self.grabber.reset()
+        try:
+            finished_moves = self.grabber.get_move_list() or []
+        except (NoSuchWindowException, InvalidSessionIdException):
+            raise
+        except WebDriverException:
+            finished_moves = list(self.board_sync.moves)
+        if self.enable_non_stop_puzzles and is_puzzles:
+            self.grabber.click_puzzle_next()
+
+        while True:
+            snapshot = self._read_page(wait=5)
+            # A new game has a move list that doesn't continue the finished one
+            if (
+                not snapshot.game_over
+                and self._check_snapshot(snapshot) is None
+                and snapshot.move_list[:len(finished_moves)] != finished_moves
+            ):
+                return snapshot
+            if snapshot.game_over:
+                # The wait returns at once while the game over window is open
+                time.sleep(NEW_GAME_POLL_INTERVAL)
+            # Read the whole move list again, the page may have been replaced
+            self.grabber.reset()
+
+    def _create_grabber(self) -> Grabber:
+        """Attach the grabber of the website to the browser"""
+        if self.website == "chesscom":
+            return ChesscomGrabber(
+                self.chrome_url, self.chrome_session_id, self.chrome_debugger_address
+            )
+        return LichessGrabber(
+            self.chrome_url, self.chrome_session_id, self.chrome_debugger_address
+        )
 
-    def _send_restart(self) -> None:
-        """sends a gui restart"""
-        self.logger.debug("sending restart")
-        self.grabber.click_puzzle_next()
-        self.pipe.send("RESTART")
-        self.wait_for_gui_to_delete()
+    def _time_to_first_move(self) -> Startup:
+        """Report the time from the start of the game to the first move made"""
+        first_move = (time.time() - self._game_started_at) * 1000
+        self._game_started_at = None
+        self.logger.info(f"time to first move: {first_move:.0f} ms {self._bootstrap}")
+        return Startup(first_move, **self._bootstrap)
 
     def run(self) -> None:
         self.logger.debug("starting stockfish bot")
-        if self.website == "chesscom":
-            self.grabber = ChesscomGrabber(self.chrome_url, self.chrome_session_id)
-        else:
-            self.grabber = LichessGrabber(self.chrome_url, self.chrome_session_id)
+        self.channel = Channel(self.pipe)
+        self._game_started_at = self.created_at
+        started = time.monotonic()
 
-        stockfish: Stockfish = self._init_stockfish()
+        def start_engine() -> tuple[UciEngine | None, float]:
+            stockfish = self._init_stockfish()
+            return stockfish, (time.monotonic() - started) * 1000
 
-        if self._check_board() == False:
-            self.pipe.send("ERR_BOARD")
-            return
+        # Start the engine and load its network in the background
+        # while the grabber attaches to the browser and reads the page
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            engine_future = executor.submit(start_engine)
 
-        if self._check_is_white() == False:
-            self.pipe.send("ERR_COLOR")
-            return
+            self.grabber = self._create_grabber()
 
-        move_list = self._check_starting_position()
-        if not move_list:
-            self.pipe.send("ERR_MOVES")
-            return
+            if self.position_store_path is not None:
+                self.position_store = PositionStore(self.position_store_path)
 
-        if self._check_game_over(move_list) == False:
-            self.pipe.send("ERR_GAMEOVER")
-            return
+            if self.syzygy_path is not None:
+                self.tablebase = TablebaseProber(self.syzygy_path)
 
-        board = chess.Board()
-        move_list_uci = self._move_board(board, move_list)
+            # Read the board, the player color and the starting position
+            snapshot = self._read_page()
+            page_time = (time.monotonic() - started) * 1000
+            error = self._check_snapshot(snapshot)
 
-        # Update Stockfish with the starting position
-        stockfish.set_position(move_list_uci)
+            stockfish, engine_time = engine_future.result()
+        if stockfish is None:
+            return
+        if error is not None:
+            self.channel.send(Error(error))
+            stockfish.quit()
+            return
+        self._bootstrap = {"engine": engine_time, "page": page_time}
+        self.board_sync = BoardSync(stockfish, self.grabber.get_fen)
 
-        # Notify GUI that bot is ready
-        self.pipe.send("START")
+        # The process, the engine, the browser connection and the caches
+        # are kept across games, a new game only resets the game state
+        try:
+            while True:
+                board = self._start_game(snapshot)
+                if board is not None:
+                    self._game_loop(board, stockfish)
+                    self._end_game()
 
-        # Send the first moves to the GUI (if there are any)
-        if len(move_list) > 0:
-            self.pipe.send("M_MOVE" + ",".join(move_list))
-        self._game_loop(board, stockfish, move_list)
+                snapshot = self._wait_for_next_game()
+                if snapshot is None:
+                    return
+                self._game_started_at = time.time()
+                self._bootstrap = {}
+                stockfish.new_game()
+        finally:
+            # Don't leave an eval update behind, if the GUI is still listening
+            try:
+                self.channel.flush()
+            except OSError:
+                pass
+
+    def _clock_limits(self) -> dict:
+        """Return the game clocks read from the page as UCI go limits"""
+        snapshot = self.grabber.last_snapshot
+        if snapshot is None or snapshot.clocks is None:
+            return {}
+        clocks = snapshot.clocks
+        return {
+            "wtime": clocks.white_time,
+            "btime": clocks.black_time,
+            "winc": clocks.white_increment,
+            "binc": clocks.black_increment,
+        }
 
-    def _think_move(self, board: chess.Board, stockfish: Stockfish) -> tuple[str, int]:
-        """think of move to make"""
-        self.logger.debug("thinking of move to make")
-        move = None
-        move_count = len(board.move_stack)
-        if not self.bongcloud or move_count > 3:
-            return stockfish.get_best_move(), move_count
+    def _search(self, board: chess.Board, stockfish: UciEngine) -> str | None:
+        """
+        Search the current position within the depth and move time limits,
+        letting Stockfish scale its thinking time to the game clocks.
+        Positions already searched deep enough are answered from the analysis cache
+        or the position store
+        """
+        entry = self.analysis_cache.get(board, self.stockfish_depth, self.skill_level)
+        if entry is None and self.position_store is not None:
+            entry = self.position_store.get(board, self.stockfish_depth, self.skill_level)
+            if entry is not None:
+                self.analysis_cache.put(board, entry, self.skill_level)
+        if entry is not None:
+            self.logger.debug(f"analysis cache hit: {entry}")
+            # Drop a ponder search that was hit and ponder on the cached reply instead
+            stockfish.set_last_result(entry.best_move, entry.ponder_move)
+            return entry.best_move
+
+        result = stockfish.search(
+            depth=self.stockfish_depth,
+            movetime=self.move_time / 1000 if self.move_time > 0 else None,
+            **self._clock_limits(),
+        )
+        # Deliver the final eval of the search, held back by the coalescing
+        self.channel.flush()
+        self.logger.debug(
+            f"searched depth {result.depth}, {result.nodes} nodes, "
+            f"{result.nps} nps in {result.elapsed:.3f}s"
+        )
+        if result.best_move is not None:
+            entry = CacheEntry(
+                result.best_move, result.ponder_move, result.score, result.depth, result.pv
+            )
+            self.analysis_cache.put(board, entry, self.skill_level)
+            if self.position_store is not None:
+                self.position_store.put(board, entry, self.skill_level)
+        return result.best_move
+
+    def _bongcloud_move(self, board: chess.Board, move_count: int) -> str | None:
+        """Return the hardcoded bongcloud move, None if there is no legal one"""
         if move_count == 0:
             move = "e2e3"
         elif move_count == 1:
@@ -248,121 +469,120 @@ class StockfishBot(multiprocess.Process):
             move = "e1e2"
         elif move_count == 3:
             move = "e8e7"
+        else:
+            return None
 
-        # Hardcoded bongcloud move is not legal,
-        # so find a legal move
         if not board.is_legal(chess.Move.from_uci(move)):
-            return stockfish.get_best_move(), move_count
-
+            return None
+        return move
 
-    def _game_loop(
-            self,
-            board: chess.Board,
-            stockfish: Stockfish,
-            move_list: list
-        ) -> None:
+    def _think_move(self, board: chess.Board, stockfish: UciEngine) -> tuple[str, int]:
+        """
+        think of move to make
+        The bongcloud, the opening book and the tablebases are tried before Stockfish
+        """
+        self.logger.debug("thinking of move to make")
+        # The ply of the game, the board may start from a position read from the page
+        move_count = self.board_sync.ply
+        move = self._bongcloud_move(board, move_count) if self.bongcloud else None
+        if move is None and self.opening_book is not None:
+            move = self.opening_book.get_move(board, move_count)
+            if move is not None:
+                self.logger.debug(f"book move: {move}")
+        if move is None and self.tablebase is not None:
+            move = self.tablebase.get_move(board)
+            if move is not None:
+                self.logger.debug(f"tablebase move: {move}")
+        if move is None:
+            return self._search(board, stockfish), move_count
+
+        # Drop a ponder search that was hit, the move is already known
+        stockfish.stop()
+        return move, move_count
+
+    def _moves_message(self, change: SyncResult) -> Moves:
+        """The GUI update for the changes the board synchronisation applied"""
+        if change.undone or change.rebuilt:
+            return Moves(list(self.board_sync.moves), replace=True)
+        return Moves(change.pushed)
+
+    def _game_loop(self, board: chess.Board, stockfish: UciEngine) -> None:
         """Start the game loop"""
         self.logger.debug("starting game loop")
         while True:
             move, move_count = self._think_move(board, stockfish)
+            self.latency.mark("think")
 
             # Wait for keypress or player movement if in manual mode
             self_moved = False
+            if self.enable_manual_mode:
+                move_start_pos, move_end_pos = self.get_move_position(move)
+                # The GUI forwards the arrows to the overlay
+                self.channel.send(Arrows([(move_start_pos, move_end_pos)]))
 
-            if not self.enable_manual_mode:
-                continue
-            
-            move_start_pos, move_end_pos = self.get_move_position(move)
-            self.overlay_queue.put(
-                [
-                    (
-                        (int(move_start_pos[0]), int(move_start_pos[1])),
-                        (int(move_end_pos[0]), int(move_end_pos[1])),
-                    ),
-                ]
-            )
-            
-            # TODO: use guard clauses
-            # if (
-                # not keyboard.is_pressed("3") 
-                # and len(move_list) == len(
-                    # self.grabber.get_move_list()
-                # )
-            # ):
-                # pass
-
-            while not keyboard.is_pressed("3"):
-                self.logger.debug("user pressed 3")
-                if len(move_list) != len(self.grabber.get_move_list()):
-                    self_moved = True
+                while not keyboard.is_pressed("3"):
                     move_list = self.grabber.get_move_list()
-                    move_san = move_list[-1]
-                    move = board.parse_san(move_san).uci()
-                    board.push_uci(move)
-                    stockfish.make_moves_from_current_position([move])
-                    break
+                    change = None if move_list is None else self.board_sync.sync(move_list)
+                    if change:
+                        self_moved = True
+                        moves_message = self._moves_message(change)
+                        break
 
             if not self_moved:
-                move_san = board.san(
-                    chess.Move(
-                        chess.parse_square(move[:2]),
-                        chess.parse_square(move[2:4]),
-                    )
-                )
-                board.push_uci(move)
-                stockfish.make_moves_from_current_position([move])
-                move_list.append(move_san)
+                move_san = self.board_sync.push_uci(move)
+                moves_message = Moves([move_san])
                 if (
                     self.enable_mouseless_mode
-                    and not self.grabber.is_game_puzzles()
+                    and not self.grabber.last_snapshot.is_puzzles
                 ):
                     self.grabber.make_mouseless_move(move, move_count + 1)
                 else:
                     self.make_move(move)
+                self.latency.mark("input")
 
-            self.overlay_queue.put([])
-
-            # Send the move to the GUI
-            self.pipe.send(f"S_MOVE{move_san}")
+            # Remove the arrows and send the move and the time spent on it to the GUI
+            messages = [Arrows([]), moves_message]
+            sample = self.latency.finish()
+            if sample:
+                messages.append(Timing(sample, self.latency.percentiles("total")))
+            if self._game_started_at is not None:
+                messages.append(self._time_to_first_move())
+            self.channel.send(*messages)
 
             # Check if the game is over
             if board.is_checkmate():
-                # Send restart message to GUI
-                if (
-                    self.enable_non_stop_puzzles
-                    and self.grabber.is_game_puzzles()
-                ):
-                    self._send_restart()
                 return
 
-            time.sleep(0.1)
+            # Think again if the moves made by hand left it our turn
+            if board.turn == self.is_white:
+                continue
+
+            # Ponder on the expected reply while the opponent thinks
+            stockfish.ponder(depth=self.stockfish_depth, **self._clock_limits())
 
-            # Wait for a response from the opponent
-            # by finding the differences between
-            # the previous and current position
-            previous_move_list = move_list.copy()
+            # Wait for a response from the opponent, or a takeback,
+            # by comparing the page move list with the board
+            snapshot = self._read_page()
             while True:
-                if self.grabber.is_game_over():
-                    # Send restart message to GUI
-                    if (
-                        self.enable_non_stop_puzzles
-                        and self.grabber.is_game_puzzles()
-                    ):
-                        self._send_restart()
+                # Deliver the ponder eval held back by the coalescing while we waited
+                self.channel.flush()
+                if snapshot.game_over or snapshot.move_list is None:
                     return
-                move_list = self.grabber.get_move_list()
-                if move_list is None:
+
+                # Time our reply from the moment the move appeared in the page
+                self.latency.start(snapshot.change_age or 0.0)
+                change = self.board_sync.sync(snapshot.move_list)
+                if change is None:
                     return
-                if len(move_list) > len(previous_move_list):
-                    break
-
-            # Get the move that the opponent made
-            move = move_list[-1]
-            self.pipe.send(f"S_MOVE{move}")
-            board.push_san(move)
-            stockfish.make_moves_from_current_position([str(board.peek())])
+                if change:
+                    self.channel.send(self._moves_message(change))
+                    if board.is_checkmate() or board.turn == self.is_white:
+                        break
+
+                # Sleep until the page changes the move list
+                # and read the page again in the same call
+                snapshot = self._read_page(wait=5)
+
+            self.latency.mark("board")
             if board.is_checkmate():
-                # Send restart message to GUI
-                if self.enable_non_stop_puzzles and self.grabber.is_game_puzzles():
-                    self._send_restart()
                 return
@@ -0,0 +1,105 @@
+from collections import OrderedDict
+
+import chess
+import chess.polyglot
+import chess.syzygy
+
+# Tablebases opened in this process, by directory
+_tablebases = {}
+
+# Probe results shared by every prober of this process,
+# (wdl, dtz) by position Zobrist hash, least recently used first
+_probes = OrderedDict()
+PROBE_CACHE_SIZE = 100_000
+
+
+def open_tablebase(directory) -> chess.syzygy.Tablebase:
+    if directory not in _tablebases:
+        _tablebases[directory] = chess.syzygy.open_tablebase(directory)
+    return _tablebases[directory]
+
+
+class TablebaseProber:
+    """Picks endgame moves from a local directory of Syzygy tablebases"""
+
+    def __init__(self, directory) -> None:
+        self.directory = directory
+        self.tablebase = open_tablebase(directory)
+        # Table names look like "KQvKR", so their length is the piece count plus one
+        self.max_pieces = max((len(name) - 1 for name in self.tablebase.wdl), default=0)
+
+    def covers(self, board: chess.Board) -> bool:
+        """Returns True if the position may be in the tablebases"""
+        return (
+            len(board.piece_map()) <= self.max_pieces
+            and not board.castling_rights
+        )
+
+    def probe(self, board: chess.Board) -> tuple[int, int | None] | None:
+        """
+        Returns the WDL and DTZ values of the position from the side to move's
+        point of view, the DTZ is None if its table is missing.
+        Returns None if the position is not in the tablebases
+        """
+        key = chess.polyglot.zobrist_hash(board)
+        if key in _probes:
+            _probes.move_to_end(key)
+            return _probes[key]
+
+        try:
+            wdl = self.tablebase.probe_wdl(board)
+        except KeyError:
+            # Missing table or castling rights
+            return None
+        try:
+            dtz = self.tablebase.probe_dtz(board)
+        except KeyError:
+            dtz = None
+
+        _probes[key] = (wdl, dtz)
+        if len(_probes) > PROBE_CACHE_SIZE:
+            _probes.popitem(last=False)
+        return wdl, dtz
+
+    def get_move(self, board: chess.Board) -> str | None:
+        """
+        Returns the move keeping the best tablebase result in UCI notation,
+        converting wins as fast as possible and dragging losses out.
+        Returns None if the position is not in the tablebases,
+        or if a move wins or loses and its DTZ table is missing
+        """
+        if not self.covers(board):
+            return None
+
+        best_move = None
+        best_rank = None
+        for move in board.legal_moves:
+            board.push(move)
+            try:
+                if board.is_checkmate():
+                    rank = (3, 0)
+                else:
+                    result = self.probe(board)
+                    if result is None:
+                        return None
+                    # The probe is from the opponent's point of view
+                    wdl, dtz = -result[0], result[1]
+                    if wdl != 0 and dtz is None:
+                        # Without the DTZ every winning move ranks the same, and playing
+                        # the first one may never make progress, let the engine decide
+                        return None
+                    dtz = abs(dtz or 0)
+                    if wdl > 0:
+                        rank = (wdl, -dtz)
+                    elif wdl < 0:
+                        rank = (wdl, dtz)
+                    else:
+                        rank = (wdl, 0)
+            finally:
+                board.pop()
+
+            if best_rank is None or rank > best_rank:
+                best_move = move
+                best_rank = rank
+
+        return None if best_move is None else best_move.uci()
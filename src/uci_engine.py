@@ -0,0 +1,342 @@
+import logging
+import queue
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, field
+
+
+class EngineError(OSError):
+    """Raised when the engine process stops responding or exits"""
+
+
+class EngineTimeout(EngineError):
+    """Raised when the engine doesn't answer in time"""
+
+
+@dataclass
+class SearchResult:
+    """The outcome of a search"""
+    best_move: str | None
+    ponder_move: str | None = None
+    # Statistics of the last info line of the search
+    depth: int = 0
+    nodes: int = 0
+    nps: int = 0
+    # ("cp", centipawns) or ("mate", moves), from the side to move's point of view
+    score: tuple | None = None
+    pv: list = field(default_factory=list)
+    # Wall-clock seconds spent waiting for the result
+    elapsed: float = 0.0
+    # True if the search was stopped because it ran out of time
+    timed_out: bool = False
+
+
+class UciEngine:
+    """
+    Drives a UCI engine directly over the subprocess pipes.
+    A reader thread streams the engine output, parses the info lines
+    and hands every other line to the caller through a queue
+    """
+
+    def __init__(
+        self,
+        path,
+        depth=15,
+        parameters=None,
+        info_callback=None,
+        timeout=10.0,
+    ) -> None:
+        """
+        Args:
+            path: The engine executable, or a command list
+            depth: The depth searched by get_best_move
+            parameters: A dict of UCI options to set
+            info_callback: Called from the reader thread with every parsed info line
+            timeout: Seconds to wait for the engine to answer a handshake
+        Raises:
+            PermissionError: If the engine is not executable
+            OSError: If the engine can't be started or doesn't speak UCI
+        """
+        self.logger = logging.getLogger(f"CAB.{self.__class__.__name__}")
+        self.depth = depth
+        self.info_callback = info_callback
+        self.timeout = timeout
+
+        self.process = subprocess.Popen(
+            path if isinstance(path, list) else [path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            bufsize=1,
+        )
+        self._lines = queue.Queue()
+        self._reader = threading.Thread(target=self._read_lines, daemon=True)
+        self._reader.start()
+
+        # The position the engine is set to
+        self._fen = None
+        self._moves = []
+
+        # Whether a "go" command is running, and the move pondered on if it is a ponder search
+        self._searching = False
+        self._ponder_move = None
+
+        # The last bestmove answer
+        self.best_move = None
+        self.ponder_move = None
+
+        # The last info line of the current search
+        self.info = {}
+
+        self._send("uci")
+        self._wait_for("uciok", self.timeout)
+        for name, value in (parameters or {}).items():
+            self.set_option(name, value)
+        self.is_ready()
+
+    def _read_lines(self) -> None:
+        for line in self.process.stdout:
+            line = line.strip()
+            if line.startswith("info"):
+                self._on_info(line)
+            elif line:
+                self._lines.put(line)
+        # The engine exited
+        self._lines.put(None)
+
+    def _on_info(self, line) -> None:
+        info = parse_info(line)
+        # Lines like "info depth 20 currmove e2e4 currmovenumber 1" carry no result,
+        # keep the last one that does
+        if "depth" not in info or ("score" not in info and "pv" not in info):
+            return
+        self.info = info
+        if self.info_callback is not None:
+            self.info_callback(info)
+
+    def _send(self, command) -> None:
+        self.logger.debug(f"> {command}")
+        try:
+            self.process.stdin.write(command + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError) as e:
+            raise EngineError("The engine process has exited") from e
+
+    def _wait_for(self, prefix, timeout=None) -> str:
+        """Returns the first line starting with prefix, dropping the other lines"""
+        while True:
+            try:
+                line = self._lines.get(timeout=timeout)
+            except queue.Empty as e:
+                raise EngineTimeout(f"The engine didn't answer {prefix} in time") from e
+            if line is None:
+                raise EngineError("The engine process has exited")
+            if line.startswith(prefix):
+                return line
+
+    def set_option(self, name, value) -> None:
+        if isinstance(value, bool):
+            value = "true" if value else "false"
+        self._send(f"setoption name {name} value {value}")
+
+    def is_ready(self) -> None:
+        self._send("isready")
+        self._wait_for("readyok", self.timeout)
+
+    def new_game(self) -> None:
+        self.stop()
+        self._send("ucinewgame")
+        self.is_ready()
+        self.set_position()
+
+    def set_position(self, moves=None, fen=None) -> None:
+        """Sets the position from the starting position (or a FEN) and a list of UCI moves"""
+        self.stop()
+        self._fen = fen
+        self._moves = list(moves or [])
+
+    def make_moves_from_current_position(self, moves) -> None:
+        """
+        Plays the given UCI moves from the current position.
+        If the engine is pondering on the first move, the ponder search
+        becomes the real search, otherwise the ponder search is stopped
+        """
+        moves = list(moves)
+        if self._ponder_move is not None:
+            if moves and moves[0] == self._ponder_move:
+                self.logger.debug(f"ponder hit: {self._ponder_move}")
+                self._send("ponderhit")
+                self._ponder_move = None
+                self._moves.append(moves.pop(0))
+                if moves:
+                    self.stop()
+            else:
+                self.stop()
+        self._moves.extend(moves)
+
+    def _position_command(self, moves) -> str:
+        command = "position startpos" if self._fen is None else f"position fen {self._fen}"
+        if moves:
+            command += " moves " + " ".join(moves)
+        return command
+
+    def go(self, ponder_move=None, **limits) -> None:
+        """
+        Starts searching the current position, or the position after
+        ponder_move in ponder mode. The limits are passed to the go command
+        Ex. go(depth=15), go(wtime=60000, btime=60000)
+        """
+        self.stop()
+        moves = self._moves if ponder_move is None else self._moves + [ponder_move]
+        self._send(self._position_command(moves))
+
+        command = "go"
+        if ponder_move is not None:
+            command += " ponder"
+        for name, value in limits.items():
+            if value is not None:
+                command += f" {name} {value}"
+        self.info = {}
+        self._searching = True
+        self._ponder_move = ponder_move
+        self._send(command)
+
+    def ponder(self, **limits) -> bool:
+        """
+        Starts pondering on the reply expected by the last search,
+        if the last move played is the best move it found.
+        The limits apply once the ponder search is hit, they default to the depth
+        Returns True if the engine started pondering
+        """
+        if (
+            self.ponder_move is None
+            or not self._moves
+            or self._moves[-1] != self.best_move
+        ):
+            return False
+        self.go(ponder_move=self.ponder_move, **(limits or {"depth": self.depth}))
+        return True
+
+    def wait_for_best_move(self, timeout=None) -> str | None:
+        """Waits for the running search to finish and returns its best move"""
+        line = self._wait_for("bestmove", timeout)
+        self._searching = False
+        self._ponder_move = None
+
+        parts = line.split()
+        self.best_move = parts[1] if len(parts) > 1 and parts[1] != "(none)" else None
+        self.ponder_move = parts[3] if len(parts) > 3 and parts[2] == "ponder" else None
+        return self.best_move
+
+    def set_last_result(self, best_move, ponder_move=None) -> None:
+        """
+        Records a result found without searching, Ex. from the analysis cache,
+        as the last bestmove answer, stopping the running search.
+        ponder() then ponders on its expected reply once best_move is played
+        """
+        self.stop()
+        self.best_move = best_move
+        self.ponder_move = ponder_move
+
+    def get_best_move(self) -> str | None:
+        """
+        Returns the best move of the current position.
+        If a ponder search was hit, its result is returned as soon as it is available
+        """
+        return self.search(depth=self.depth).best_move
+
+    def search(self, depth=None, movetime=None, nodes=None, **clocks) -> SearchResult:
+        """
+        Searches the current position until the depth or node budget is reached
+        or the wall-clock budget runs out, whichever comes first.
+        When time runs out the search is stopped and the best move found so far
+        is returned, leaving the engine ready for the next command.
+        If a ponder search was hit, it carries on under the same budget
+        Args:
+            depth: The maximum depth to search
+            movetime: The wall-clock budget in seconds
+            nodes: The maximum number of nodes to search
+            clocks: wtime, btime, winc and binc in milliseconds,
+                to let the engine allocate its time from the game clocks
+        Returns:
+            A SearchResult
+        """
+        started = time.monotonic()
+        if not self._searching:
+            self.go(depth=depth, nodes=nodes, **clocks)
+
+        timed_out = False
+        try:
+            self.wait_for_best_move(movetime)
+        except EngineTimeout:
+            # Out of time, stop the search and drain its bestmove answer
+            timed_out = True
+            self._send("stop")
+            self.wait_for_best_move(self.timeout)
+
+        info = self.info
+        return SearchResult(
+            best_move=self.best_move,
+            ponder_move=self.ponder_move,
+            depth=info.get("depth", 0),
+            nodes=info.get("nodes", 0),
+            nps=info.get("nps", 0),
+            score=info.get("score"),
+            pv=info.get("pv", []),
+            elapsed=time.monotonic() - started,
+            timed_out=timed_out,
+        )
+
+    def stop(self) -> None:
+        """Stops the running search, if any, and drains its bestmove answer"""
+        if not self._searching:
+            return
+        self._send("stop")
+        self.wait_for_best_move(self.timeout)
+
+    def quit(self) -> None:
+        if self.process.poll() is not None:
+            return
+        try:
+            self._send("quit")
+            self.process.wait(timeout=1)
+        except (EngineError, subprocess.TimeoutExpired):
+            self.process.kill()
+
+    def __del__(self) -> None:
+        if hasattr(self, "process"):
+            self.quit()
+
+
+def parse_info(line) -> dict:
+    """
+    Parses a UCI info line
+    Ex. "info depth 12 score cp 31 nodes 1200 nps 600000 pv e2e4 e7e5"
+    -> {"depth": 12, "score": ("cp", 31), "nodes": 1200, "nps": 600000, "pv": ["e2e4", "e7e5"]}
+    """
+    tokens = line.split()[1:]
+    info = {}
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token == "pv":
+            info["pv"] = tokens[i + 1:]
+            break
+        if token == "string":
+            info["string"] = " ".join(tokens[i + 1:])
+            break
+        if token == "score" and i + 2 < len(tokens):
+            info["score"] = (tokens[i + 1], int(tokens[i + 2]))
+            i += 3
+            # Skip the lowerbound/upperbound flags
+            while i < len(tokens) and tokens[i] in ("lowerbound", "upperbound"):
+                i += 1
+            continue
+        if i + 1 < len(tokens) and tokens[i + 1].lstrip("-").isdigit():
+            info[token] = int(tokens[i + 1])
+            i += 2
+            continue
+        i += 1
+    return info
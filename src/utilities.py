@@ -1,5 +1,4 @@
-from typing import Any
-from selenium import webdriver
+from selenium.webdriver.remote.remote_connection import RemoteConnection
 from selenium.webdriver.remote.webdriver import WebDriver
 
 
@@ -9,25 +8,23 @@ def char_to_num(char) -> int:
     return ord(char) - ord("a") + 1
 
 
-# Attaches to a running webdriver
-# Returns the webdriver
-# Taken from https://stackoverflow.com/a/48194907/5868441
-def attach_to_session(executor_url, session_id) -> WebDriver:
-    original_execute = WebDriver.execute
-
-    def new_command_execute(self, command, params=None)-> dict[str, Any] | dict:
-        if command == "newSession":
-            # Mock the response
-            return {"success": 0, "value": None, "sessionId": session_id}
+class AttachedWebDriver(WebDriver):
+    """A WebDriver attached to a running session instead of starting a new one"""
 
-        return original_execute(self, command, params)
+    def __init__(self, command_executor, session_id) -> None:
+        self._attached_session_id = session_id
+        super().__init__(command_executor=command_executor)
 
-    # Patch the function before creating the driver object
-    WebDriver.execute = new_command_execute
-    driver = webdriver.Remote(command_executor=executor_url, desired_capabilities={})
-    driver.session_id = session_id
+    def start_session(self, capabilities, browser_profile=None) -> None:
+        # Only this instance skips the newSession command, the WebDriver class is left alone
+        self.session_id = self._attached_session_id
+        self.caps = {}
 
-    # Replace the patched function with original function
-    WebDriver.execute = original_execute
 
-    return driver
\ No newline at end of file
+# Attaches to a running webdriver
+# Returns the webdriver
+# Its commands reuse a kept-alive HTTP connection to chromedriver,
+# and skip any proxy set in the environment since chromedriver runs locally
+def attach_to_session(executor_url, session_id) -> WebDriver:
+    connection = RemoteConnection(executor_url, keep_alive=True, ignore_proxy=True)
+    return AttachedWebDriver(connection, session_id)